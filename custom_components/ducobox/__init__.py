@@ -5,6 +5,7 @@ from __future__ import annotations
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.config_entries import SOURCE_IGNORE, ConfigEntry
+from homeassistant.exceptions import ConfigEntryNotReady
 
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
@@ -41,11 +42,25 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.update_coordinator import (
     DataUpdateCoordinator,
 )
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.core import callback
 
 
 import logging
 
-from .ducobox import DucoBoxBase
+from .ducobox import (
+    DucoBoxBase,
+    IntervalTuner,
+    TRANSPORT_SERIAL,
+    DEFAULT_TCP_PORT,
+    DEFAULT_UPDATE_INTERVAL,
+    deadbands_from_options,
+    port_name,
+)
 from datetime import timedelta
 
 
@@ -55,26 +70,221 @@ _LOGGER = logging.getLogger(__name__)
 
 PLATFORMS: list[str] = ["sensor", "number", "fan"]  # "select",
 
+STORAGE_VERSION = 1
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    dbb = DucoBoxBase(
-        entry.data["serial_port"],
-        baudrate=entry.data["baudrate"],
-        slave_adr=entry.data["slave_adr"],
-        simulate=entry.data["simulate"],
+# Hot-plugged modules are picked up by a periodic rescan of the bus
+RESCAN_INTERVAL = timedelta(hours=1)
+
+# DucoBoxes validated by the config flow, connected and scanned, waiting for
+# the setup of their entry: {unique id: DucoBoxBase}
+validated_boxes = {}
+
+
+def box_unique_id(data) -> str:
+    """Unique id of an entry, "<port> slave <slave adress>"; a slave is added once"""
+    port = port_name(
+        data.get("transport", TRANSPORT_SERIAL),
+        data["serial_port"],
+        data.get("host"),
+        data.get("tcp_port", DEFAULT_TCP_PORT),
     )
-    await dbb.create_serial_connection()
-    await dbb.scan_modules()
+    return "%s slave %d" % (port, data.get("slave_adr", 1))
+
+
+async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    dbb = validated_box = validated_boxes.pop(entry.unique_id, None)
+    if dbb is None:
+        dbb = DucoBoxBase(
+            entry.data["serial_port"],
+            baudrate=entry.data["baudrate"],
+            slave_adr=entry.data["slave_adr"],
+            simulate=entry.data["simulate"],
+            transport=entry.data.get("transport", TRANSPORT_SERIAL),
+            host=entry.data.get("host"),
+            tcp_port=entry.data.get("tcp_port", DEFAULT_TCP_PORT),
+        )
+        await dbb.create_serial_connection()
+        if dbb.mb_client is None:
+            # e.g. a USB dongle which is not enumerated yet, setup is retried
+            await dbb.close()
+            raise ConfigEntryNotReady("Failed to open %s" % dbb.port_name)
+    # The device ids stay the same when the port or gateway is renamed
+    dbb.set_namespace(entry.entry_id)
+    dbb.deadbands = deadbands_from_options(entry.options)
+    # Disabled entities are not added, their registers are not polled
+    dbb.demand_driven = True
+
+    store = topology_store(hass, entry)
+    topology = await store.async_load()
+    if dbb.modules:
+        # Just scanned by the config flow
+        await store.async_save(dbb.export_topology())
+    elif topology:
+        # Start with the known topology, the discovery checks the bus
+        dbb.load_topology(topology)
 
     coordinator = DucoSensorCoordinator(hass, dbb)
+    coordinator.configure(entry.options)
 
     hass.data.setdefault(DOMAIN, {})[entry.entry_id] = dbb, coordinator
 
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
+
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    # The platforms add the entities of the modules found later on
+    @callback
+    def async_rescan(now=None):
+        entry.async_create_background_task(
+            hass, async_discover(hass, entry, dbb, store), "ducobox discovery"
+        )
+
+    if not validated_box:
+        async_rescan()
+    entry.async_on_unload(
+        async_track_time_interval(hass, async_rescan, RESCAN_INTERVAL)
+    )
+
+    return True
+
+
+async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Move the device and entity identifiers into the namespace of the entry
+
+    Version 1 identified the modules of slave 1 by their bare base adress, so
+    two entries on different ports collided, and had no unique id.
+    """
+    if entry.version == 1:
+        namespace = entry.entry_id
+
+        # device registry id -> (old device id, new device id)
+        renamed = {}
+        device_registry = dr.async_get(hass)
+        for device in dr.async_entries_for_config_entry(
+            device_registry, entry.entry_id
+        ):
+            for domain, old in device.identifiers:
+                # Modules: "<base adress>" or "<slave adress>-<base adress>"
+                old = str(old)
+                if domain != DOMAIN or not old.replace("-", "").isdigit():
+                    continue
+                new = "%s %s" % (namespace, old.rpartition("-")[2])
+                device_registry.async_update_device(
+                    device.id, new_identifiers={(DOMAIN, new)}
+                )
+                renamed[device.id] = (old, new)
+
+        @callback
+        def migrate_unique_id(entity_entry: er.RegistryEntry) -> dict | None:
+            if entity_entry.device_id not in renamed:
+                return None
+            old, new = renamed[entity_entry.device_id]
+            unique_id = entity_entry.unique_id
+            if " @adr %s " % old in unique_id:
+                # sensor alias
+                unique_id = unique_id.replace(" @adr %s " % old, " @adr %s " % new, 1)
+            elif unique_id.startswith("FAN_") and unique_id.endswith(old):
+                unique_id = unique_id[: -len(old)] + new
+            else:
+                return None
+            return {"new_unique_id": unique_id}
+
+        await er.async_migrate_entries(hass, entry.entry_id, migrate_unique_id)
+        unique_id = entry.unique_id
+        if unique_id is None:
+            # The config flow aborts when the same slave is added again
+            unique_id = box_unique_id(entry.data)
+            if any(
+                other.unique_id == unique_id
+                for other in hass.config_entries.async_entries(DOMAIN)
+            ):
+                # Already added twice, keep the duplicate without unique id
+                unique_id = None
+        hass.config_entries.async_update_entry(entry, version=2, unique_id=unique_id)
+        _LOGGER.info("Migrated %s to version 2" % entry.title)
+
+    return True
+
+
+async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Unload the platforms, stop polling and release the port."""
+    if not await hass.config_entries.async_unload_platforms(entry, PLATFORMS):
+        return False
+
+    dbb, coordinator = hass.data[DOMAIN].pop(entry.entry_id)
+    await coordinator.async_shutdown()
+    # Flushes the pending writes, the topology stays stored for a fast reload
+    await dbb.close()
     return True
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Delete the stored topology of a removed entry."""
+    await topology_store(hass, entry).async_remove()
+
+
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Apply changed publish filters and update interval, no reload needed."""
+    dbb, coordinator = hass.data[DOMAIN][entry.entry_id]
+    dbb.deadbands = deadbands_from_options(entry.options)
+    coordinator.configure(entry.options)
+
+
+def topology_store(hass: HomeAssistant, entry: ConfigEntry) -> Store:
+    """Store with the modules and sensors found on the bus of the entry"""
+    return Store(hass, STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.topology")
+
+
+def signal_new_modules(entry: ConfigEntry) -> str:
+    """Dispatcher signal with the modules added to the entry"""
+    return "%s_new_modules_%s" % (DOMAIN, entry.entry_id)
+
+
+def signal_new_sensors(entry: ConfigEntry) -> str:
+    """Dispatcher signal with the sensors added to known modules of the entry"""
+    return "%s_new_sensors_%s" % (DOMAIN, entry.entry_id)
+
+
+async def async_discover(
+    hass: HomeAssistant, entry: ConfigEntry, dbb: DucoBoxBase, store: Store
+) -> None:
+    """Rescan the bus, add the new modules and sensors, retire the removed ones."""
+    added, removed = await dbb.rescan()
+    # The sensors of restored modules may differ from the bus (e.g. a firmware update)
+    added_sensors, removed_sensors = await dbb.reconcile_sensors(
+        [module for module in dbb.modules if module not in added]
+    )
+    if not (added or removed or added_sensors or removed_sensors):
+        if not dbb.modules:
+            _LOGGER.warning("No modules detected on %s" % entry.title)
+        return
+
+    await store.async_save(dbb.export_topology())
+
+    device_registry = dr.async_get(hass)
+    for module in removed:
+        device = device_registry.async_get_device(
+            identifiers={(DOMAIN, module.device_id)}
+        )
+        if device is not None:
+            # Removes the device and its entities
+            device_registry.async_update_device(
+                device.id, remove_config_entry_id=entry.entry_id
+            )
+
+    entity_registry = er.async_get(hass)
+    for sens in removed_sensors:
+        for platform in ("sensor", "number"):
+            entity_id = entity_registry.async_get_entity_id(platform, DOMAIN, sens.alias)
+            if entity_id is not None:
+                entity_registry.async_remove(entity_id)
+
+    if added:
+        async_dispatcher_send(hass, signal_new_modules(entry), added)
+    if added_sensors:
+        async_dispatcher_send(hass, signal_new_sensors(entry), added_sensors)
+
+
 class DucoSensorCoordinator(DataUpdateCoordinator):
     """My custom coordinator."""
 
@@ -84,17 +294,63 @@ class DucoSensorCoordinator(DataUpdateCoordinator):
             hass,
             _LOGGER,
             name="DucoBox coordinator",
-            update_interval=timedelta(seconds=10),
+            update_interval=timedelta(seconds=DEFAULT_UPDATE_INTERVAL),
+            # listeners are only called when the change set is not empty
+            always_update=False,
         )
         self.dbb = dbb
+        self.tuner = None
+
+    def configure(self, options):
+        """Apply the update interval options, optionally tuned automatically"""
+        interval = options.get("update_interval", DEFAULT_UPDATE_INTERVAL)
+        self.tuner = IntervalTuner(interval) if options.get("auto_interval") else None
+        if self.tuner:
+            interval = self.tuner.interval
+        self.update_interval = timedelta(seconds=interval)
 
     async def _async_update_data(self):
         """Fetch data from API endpoint.
 
-        This is the place to pre-process the data to lookup tables
-        so entities can quickly look up their data.
+        Returns the change set of the poll cycle ({sensor alias: value}),
+        entities only write their state when their alias is part of it.
+        """
+        changes = await self.dbb.update_sensors()
+
+        if self.tuner:
+            metrics = self.dbb.transactions.metrics
+            interval = self.tuner.update(
+                metrics.cycle_duration,
+                metrics.cycle["frames"],
+                metrics.cycle["timeouts"] + metrics.cycle["crc_errors"],
+            )
+            if interval != self.update_interval.total_seconds():
+                _LOGGER.debug("Update interval tuned to %.1f s" % interval)
+                self.update_interval = timedelta(seconds=interval)
+
+        return changes
+
+
+class DucoCoordinatorEntity(CoordinatorEntity):
+    """Coordinator entity which only writes its state when it changed"""
+
+    _written_available = None
+
+    @callback
+    def _write_on_change(self, *keys) -> None:
+        """Write the state when one of the keys is part of the change set
+
+        The availability is written as well when it changed, e.g. after a
+        failed refresh (the change set of the previous refresh is kept then)
+        and after the recovery.
         """
-        return await self.dbb.update_sensors()
+        data = self.coordinator.data
+        available = self.available
+        if available != self._written_available or (
+            data is not None and any(key in data for key in keys)
+        ):
+            self._written_available = available
+            self.async_write_ha_state()
 
 
 def get_unit(name):
@@ -1,11 +1,20 @@
 from homeassistant import config_entries
+from homeassistant.core import callback
 import logging
 import voluptuous as vol
 from typing import Any, Dict, Optional
 
-from .ducobox import DucoBoxBase
+from .ducobox import (
+    DucoBoxBase,
+    TRANSPORTS,
+    TRANSPORT_SERIAL,
+    DEFAULT_TCP_PORT,
+    DEADBAND_SENSORS,
+    DEFAULT_UPDATE_INTERVAL,
+    default_deadbands,
+)
 
-from . import DOMAIN
+from . import DOMAIN, box_unique_id, validated_boxes
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -15,23 +24,66 @@ USER_CONFIG = vol.Schema(
         vol.Required("baudrate", default=9600): int,
         vol.Optional("slave_adr", default=1): vol.All(int, vol.Range(min=1, max=32)),
         vol.Optional("simulate", default=0): vol.All(int, vol.Range(min=0, max=1)),
+        vol.Optional("transport", default=TRANSPORT_SERIAL): vol.In(TRANSPORTS),
+        vol.Optional("host", default=""): str,
+        vol.Optional("tcp_port", default=DEFAULT_TCP_PORT): vol.All(
+            int, vol.Range(min=1, max=65535)
+        ),
     }
 )
 
 
+def options_schema(options):
+    """Update interval and publish filter settings, the defaults are the
+    current options"""
+    schema = {
+        vol.Optional(
+            "update_interval",
+            default=options.get("update_interval", DEFAULT_UPDATE_INTERVAL),
+        ): vol.All(int, vol.Range(min=1, max=3600)),
+        vol.Optional(
+            "auto_interval", default=options.get("auto_interval", False)
+        ): bool,
+    }
+    for prefix in DEADBAND_SENSORS:
+        default = default_deadbands[prefix]
+        schema[
+            vol.Optional(
+                prefix + "_deadband",
+                default=options.get(prefix + "_deadband", default.absolute),
+            )
+        ] = vol.All(vol.Coerce(float), vol.Range(min=0))
+        schema[
+            vol.Optional(
+                prefix + "_relative_deadband",
+                default=options.get(
+                    prefix + "_relative_deadband", 100 * default.relative
+                ),
+            )
+        ] = vol.All(vol.Coerce(float), vol.Range(min=0, max=100))
+        schema[
+            vol.Optional(
+                prefix + "_heartbeat",
+                default=options.get(prefix + "_heartbeat", default.heartbeat),
+            )
+        ] = vol.All(int, vol.Range(min=0))
+    return vol.Schema(schema)
+
+
 async def check_config(user_input):
-    ret = False
+    """Connect and scan, returns the DucoBoxBase or None when nothing answers"""
+    dbb = DucoBoxBase(**user_input)
     try:
-        dbb = DucoBoxBase(**user_input)
         await dbb.create_serial_connection()
         await dbb.scan_modules()
         if len(dbb.modules) > 0:
-            ret = True
+            return dbb
     except:
         _LOGGER.exception("Could not reach any module")
         # TODO: report errors
         pass
-    return ret
+    await dbb.close()
+    return None
 
 
 class DucoboxConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -39,15 +91,24 @@ class DucoboxConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     # The schema version of the entries that it creates
     # Home Assistant will call your migrate method if the version changes
-    VERSION = 1
+    VERSION = 2
 
     async def async_step_user(self, user_input=None):
         errors: Dict[str, str] = {}
         if user_input is not None:
+            # Several boxes can share a port, but each slave only once
+            await self.async_set_unique_id(box_unique_id(user_input))
+            self._abort_if_unique_id_configured()
+
             # Validate user input
-            valid = await check_config(user_input)
+            dbb = await check_config(user_input)
+            valid = dbb is not None
             if valid:
-                # See next section on create entry usage
+                # Hand the connection and the scan over to async_setup_entry
+                stale = validated_boxes.pop(self.unique_id, None)
+                if stale is not None:
+                    await stale.close()
+                validated_boxes[self.unique_id] = dbb
                 return self.async_create_entry(
                     title="Ducobox Focus",
                     data=user_input,
@@ -59,3 +120,20 @@ class DucoboxConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         return self.async_show_form(
             step_id="user", data_schema=USER_CONFIG, errors=errors
         )
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return DucoboxOptionsFlow()
+
+
+class DucoboxOptionsFlow(config_entries.OptionsFlow):
+    """Update interval and publish filters of the noisy sensors."""
+
+    async def async_step_init(self, user_input=None):
+        if user_input is not None:
+            return self.async_create_entry(data=user_input)
+
+        return self.async_show_form(
+            step_id="init", data_schema=options_schema(self.config_entry.options)
+        )
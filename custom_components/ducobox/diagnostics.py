@@ -0,0 +1,55 @@
+"""Diagnostics support for the DucoBox integration."""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from . import DOMAIN
+
+
+def _sensor_diagnostics(sens) -> dict[str, Any]:
+    data = {
+        "register": sens.register,
+        "functioncode": sens.functioncode,
+        "value": sens.value,
+        "health": sens.health.state,
+        "failures": sens.health.failures,
+        "subscribers": sens.subscribers,
+    }
+    if sens.history is not None:
+        data["statistics"] = sens.history.statistics(sens.number_of_decimals)
+        data["history"] = [
+            (datetime.fromtimestamp(timestamp, timezone.utc).isoformat(), value)
+            for timestamp, value in sens.history.samples()
+        ]
+    return data
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    dbb, _ = hass.data[DOMAIN][entry.entry_id]
+
+    return {
+        "config": dict(entry.data),
+        "port": dbb.port_name,
+        "topology": dbb.export_topology(),
+        "bus": dbb.transactions.metrics.as_dict(),
+        "latency_p99": {
+            module.base_adr: dbb.transactions.p99(module.base_adr)
+            for module in dbb.modules
+        },
+        "modules": {
+            "%s @adr %d" % (module.name, module.base_adr): {
+                "health": module.health,
+                "sensors": {
+                    sens.name: _sensor_diagnostics(sens) for sens in module.sensors
+                },
+            }
+            for module in dbb.modules
+        },
+    }
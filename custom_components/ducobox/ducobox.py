@@ -1,18 +1,40 @@
 import asyncio
-from asynciominimalmodbus import AsyncioInstrument
-from minimalmodbus import MODE_RTU, ModbusException, SlaveReportedException, Instrument 
+from collections import deque
+import itertools
 import logging
-import random
-
-from asyncio import Lock
+import time
+
+try:
+    from .modbus_rtu import (
+        ModbusException,
+        ModbusRtuClient,
+        NoResponseError,
+        SlaveReportedException,
+        decode_value,
+        encode_value,
+    )
+    from .modbus_tcp import DEFAULT_TCP_PORT, ModbusRtuOverTcpClient, ModbusTcpClient
+    from .history import ValueHistory
+    from .metrics import BusMetrics
+except ImportError:
+    # Running this file directly
+    from modbus_rtu import (
+        ModbusException,
+        ModbusRtuClient,
+        NoResponseError,
+        SlaveReportedException,
+        decode_value,
+        encode_value,
+    )
+    from modbus_tcp import DEFAULT_TCP_PORT, ModbusRtuOverTcpClient, ModbusTcpClient
+    from history import ValueHistory
+    from metrics import BusMetrics
 
 _LOGGER = logging.getLogger(__name__)
 
 ## file:///C:/Users/gebruiker/Downloads/informatieblad-ModBus-RTU-(nl).pdf
 # https://www.duco.eu/Wes/CDN/1/Attachments/informatieblad-ModBus-RTU-(nl)_638085224731148696.pdf
 
-modbus_lock = Lock()
-
 status_mapping = {
     0: "Auto",
     1: "10 min high",
@@ -38,210 +60,1122 @@ action_mapping = {
     6: "Away",
 }
 
-SIMULATION_MODE = False
+TRANSPORT_SERIAL = "serial"
+TRANSPORT_TCP = "tcp"
+TRANSPORT_RTU_OVER_TCP = "rtu_over_tcp"
+TRANSPORTS = [TRANSPORT_SERIAL, TRANSPORT_TCP, TRANSPORT_RTU_OVER_TCP]
+
+# Base adresses of the modules connected to the box
+module_addresses = range(10, 90, 10)
+
+# Probe result of a module adress when the box did not answer
+MODULE_UNREACHABLE = "unreachable"
+
+# Number of unused registers a block read may bridge. Every module occupies a
+# window of 10 registers, so by default a module is fetched with a single
+# transaction per function code.
+MAX_BLOCK_GAP = 9
+
+# Refresh classes, the period is expressed in seconds (None = read once). The
+# update interval may be tuned, so the periods do not depend on it.
+REFRESH_FAST = "fast"
+REFRESH_SLOW = "slow"
+REFRESH_ONCE = "once"
+
+refresh_periods = {
+    REFRESH_FAST: 0,
+    REFRESH_SLOW: 300,
+    REFRESH_ONCE: None,
+}
+
+# Quiet period before pending actuator writes are sent (seconds)
+WRITE_DEBOUNCE = 0.3
+# Time pending writes get to reach the box when it is closed (seconds)
+WRITE_DRAIN_TIMEOUT = 5
+
+# Transactions with a lower value are served first
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+# Re-probes of quarantined sensors only use idle bus time
+PRIORITY_PROBE = 2
+
+# Health states of sensors and modules
+HEALTH_HEALTHY = "healthy"
+HEALTH_DEGRADED = "degraded"
+HEALTH_QUARANTINED = "quarantined"
+
+# Consecutive failed reads before a sensor is quarantined
+QUARANTINE_AFTER = 3
+# Re-probe interval of a quarantined sensor, doubled after every failed
+# probe up to the maximum (seconds)
+PROBE_INTERVAL = 60
+MAX_PROBE_INTERVAL = 3600
+
+# Consecutive timeouts on a module before its circuit breaker opens, an open
+# module is skipped and only its type register is probed (same back-off)
+BREAKER_TIMEOUTS = 3
+
+# Prefix of the keys of the bus metrics in the change set
+METRICS_PREFIX = "bus "
+
+# Update interval of the coordinator (seconds), the bounds apply when the
+# interval is tuned automatically
+DEFAULT_UPDATE_INTERVAL = 10
+MIN_UPDATE_INTERVAL = 2
+MAX_UPDATE_INTERVAL = 60
+
+# Noisy sensors with a publish filter: option prefix -> sensor name
+DEADBAND_SENSORS = {
+    "co2": "CO2 value",
+    "humidity": "humidity",
+    "temperature": "temperature",
+}
 
 class DucoBoxException(Exception):
     pass
 
-class GenericSensor:
-    """Generic class to read a setting from the instrument."""
+
+def module_base_adr(registeraddress):
+    """Base adress of the module owning a (zero based) register adress"""
+    return (registeraddress + 1) // 10 * 10
+
+
+class Health:
+    """Health state machine of a sensor (or the circuit breaker of a module).
+
+    A failure makes it degraded, `threshold` consecutive failures (or a
+    register which is not supported) quarantine it. A quarantined sensor is
+    no longer polled but re-probed with an exponential back-off, the first
+    successful read makes it healthy again.
+    """
+
+    __slots__ = ("threshold", "state", "failures", "probes", "next_probe")
+
+    def __init__(self, threshold=QUARANTINE_AFTER):
+        self.threshold = threshold
+        self.state = HEALTH_HEALTHY
+        self.failures = 0
+        self.probes = 0
+        self.next_probe = None
+
+    @property
+    def quarantined(self):
+        return self.state == HEALTH_QUARANTINED
+
+    def success(self):
+        """Register a successful read, returns True when it recovered"""
+        recovered = self.quarantined
+        self.state = HEALTH_HEALTHY
+        self.failures = 0
+        self.probes = 0
+        self.next_probe = None
+        return recovered
+
+    def failure(self, permanent=False, now=None):
+        """Register a failed read, returns True when it got quarantined"""
+        self.failures += 1
+        if self.quarantined:
+            self.probes += 1
+            self._schedule_probe(now)
+            return False
+
+        if permanent or self.failures >= self.threshold:
+            self.state = HEALTH_QUARANTINED
+            self._schedule_probe(now)
+            return True
+
+        self.state = HEALTH_DEGRADED
+        return False
+
+    def _schedule_probe(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        interval = min(PROBE_INTERVAL * 2**self.probes, MAX_PROBE_INTERVAL)
+        self.next_probe = now + interval
+
+    def probe_due(self, now=None):
+        if not self.quarantined:
+            return False
+        if now is None:
+            now = time.monotonic()
+        return now >= self.next_probe
+
+
+class Deadband:
+    """Publish filter of a sensor type.
+
+    A new value is published when it differs more than the deadband from the
+    published value, or when the published value is older than the heartbeat.
+    The deadband is the largest of the absolute and the relative deadband
+    (fraction of the published value), 0 disables the filter.
+    """
+
+    __slots__ = ("absolute", "relative", "heartbeat")
+
+    def __init__(self, absolute=0, relative=0, heartbeat=600):
+        self.absolute = absolute
+        self.relative = relative
+        self.heartbeat = heartbeat
+
+    def exceeded(self, published, value, silence):
+        """Check if value has to be published, silence is the age of published"""
+        if published is None or value is None:
+            return True
+        if self.heartbeat and silence >= self.heartbeat:
+            return True
+        band = max(self.absolute, self.relative * abs(published))
+        return abs(value - published) >= band
+
+
+default_deadbands = {
+    "co2": Deadband(absolute=20),
+    "humidity": Deadband(absolute=1),
+    "temperature": Deadband(absolute=0.2),
+}
+
+
+def deadbands_from_options(options):
+    """Deadbands per sensor name from the entry options
+
+    Options: <prefix>_deadband, <prefix>_relative_deadband (%) and
+    <prefix>_heartbeat (seconds) for every prefix of DEADBAND_SENSORS.
+    """
+    deadbands = {}
+    for prefix, name in DEADBAND_SENSORS.items():
+        default = default_deadbands[prefix]
+        deadbands[name] = Deadband(
+            absolute=options.get(prefix + "_deadband", default.absolute),
+            relative=options.get(
+                prefix + "_relative_deadband", 100 * default.relative
+            )
+            / 100,
+            heartbeat=options.get(prefix + "_heartbeat", default.heartbeat),
+        )
+    return deadbands
+
+
+class LinkTiming:
+    """Serial timing derived from the baudrate and the latency per module.
+
+    The response latency is measured for every module, identified by the
+    slave adress and its base adress (adr). Once enough samples are available
+    the timeout follows the observed p99 latency instead of the fixed default;
+    consecutive failures widen it again.
+    """
+
+    samples = 50
+    min_samples = 10
+    margin = 1.5
+    max_backoff = 0.5
+
+    # Longest response: 10 registers + adress, function code, count and CRC
+    max_response_bytes = 25
+
+    def __init__(self, baudrate, default_timeout=0.1, max_timeout=1.0):
+        # 11 bits per character: start, 8 data, parity and stop bit
+        self.char_time = 11 / baudrate
+        # Modbus RTU: 3.5 characters, fixed at 1.75 ms above 19200 baud
+        self.frame_gap = 3.5 * self.char_time if baudrate <= 19200 else 0.00175
+        self.default_timeout = default_timeout
+        self.min_timeout = self.max_response_bytes * self.char_time + self.frame_gap
+        self.max_timeout = max_timeout
+        self._latency = {}
+        self._failures = {}
+
+    def record(self, adr, latency):
+        self._latency.setdefault(adr, deque(maxlen=self.samples)).append(latency)
+        self._failures[adr] = 0
+
+    def record_failure(self, adr):
+        self._failures[adr] = self._failures.get(adr, 0) + 1
+
+    def p99(self, adr):
+        samples = self._latency.get(adr)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))]
+
+    def timeout(self, adr):
+        p99 = self.p99(adr)
+        if p99 is None:
+            timeout = self.default_timeout
+        else:
+            timeout = p99 * self.margin + self.frame_gap
+
+        timeout *= 2 ** min(self._failures.get(adr, 0), 4)
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def backoff(self, failures):
+        """Delay before the next attempt after a number of failed attempts"""
+        return min(self.frame_gap * 2**failures, self.max_backoff)
+
+
+class IntervalTuner:
+    """Tunes the update interval to the measured poll cycles.
+
+    On a healthy bus the interval shrinks step by step towards `headroom`
+    times the fastest recent cycle. It is stretched when a cycle overruns
+    (takes longer than `overrun` of the interval) or the share of failed
+    transactions exceeds `max_error_rate`.
+    """
+
+    samples = 20
+    headroom = 2.0
+    overrun = 0.8
+    max_error_rate = 0.05
+    shrink = 0.9
+    stretch = 1.5
 
     def __init__(
         self,
-        modbus_client,
-        module,
-        name,
-        holding_reg=None,
-        input_reg=None,
-        number_of_decimals=0,
-        value_mapping=None,
+        interval=DEFAULT_UPDATE_INTERVAL,
+        minimum=MIN_UPDATE_INTERVAL,
+        maximum=MAX_UPDATE_INTERVAL,
     ):
-        self.name = name
-        self.mb_client = modbus_client
-        self.module = module
-        self.value = None
-        self.retry_attempts = 5
-        self.retry = self.retry_attempts
-        self.holding_reg = holding_reg
-        self.input_reg = input_reg
-        self.number_of_decimals = number_of_decimals
-        self.value_mapping = value_mapping
-        
-        reg = input_reg if input_reg else holding_reg
-        self.alias = (
-            str(self.module.name)
-            + " @adr "
-            + str(self.module.base_adr)
-            + " "
-            + self.name
-            + " "
-            + str(reg)
-            #+ str(input_reg)
-            #+ " "
-            #+ str(holding_reg)
-        )
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = min(max(interval, minimum), maximum)
+        self._durations = deque(maxlen=self.samples)
+
+    def update(self, duration, frames, failures):
+        """Account for a poll cycle, returns the new interval (seconds)"""
+        self._durations.append(duration)
+        error_rate = failures / frames if frames else 0
+
+        if duration > self.overrun * self.interval or error_rate > self.max_error_rate:
+            interval = self.interval * self.stretch
+        else:
+            target = self.headroom * min(self._durations)
+            interval = max(self.interval * self.shrink, target)
+
+        self.interval = round(min(max(interval, self.minimum), self.maximum), 1)
+        return self.interval
+
+
+class WritePipeline:
+    """Coalesces and debounces actuator writes.
+
+    Only the latest value per holding register is kept. The pending registers
+    are written after a quiet period of `debounce` seconds, adjacent registers
+    in a single function 16 transaction. The written values are confirmed by
+    the next scheduled block read instead of a dedicated read-back.
+    """
 
-    async def update(self):
-        if SIMULATION_MODE:
-            new_val = random.randint(0, 10)
-            if new_val > 8:
-                new_val = None
-            await asyncio.sleep(0.01)
+    def __init__(self, transactions, debounce=WRITE_DEBOUNCE):
+        self.transactions = transactions
+        self.debounce = debounce
+        self.retry_attempts = 5
+        self._pending = {}
+        self._waiters = []
+        self._timer = None
+        # Flush started by the debounce timer
+        self._flushing = None
+
+    async def write(self, actuator, value):
+        """Queue a value (engineering units) and wait until it is written"""
+        loop = asyncio.get_running_loop()
+        self._pending[actuator.holding_reg] = (actuator, value)
+        future = loop.create_future()
+        self._waiters.append(future)
+
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(self.debounce, self._start_flush)
+
+        await future
+
+    def _start_flush(self):
+        self._timer = None
+        self._flushing = asyncio.get_running_loop().create_task(self._flush_pending())
+
+    async def _flush_pending(self):
+        try:
+            await self.flush()
+        except Exception:
+            # Already raised to the writers waiting for the flush
+            pass
+
+    async def write_now(self, writes):
+        """Write (actuator, value) pairs without debouncing
+
+        Supersedes pending values for the same registers.
+        """
+        writes = list(writes)
+        for actuator, _ in writes:
+            self._pending.pop(actuator.holding_reg, None)
+        await self.write_registers(writes)
+
+    async def drain(self):
+        """Wait for the flush in progress, then write the pending values"""
+        if self._flushing is not None:
+            await self._flushing
+        await self.flush()
+
+    async def flush(self):
+        """Write all pending values now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending, self._pending = self._pending, {}
+        waiters, self._waiters = self._waiters, []
+        try:
+            await self.write_registers(pending.values())
+        except Exception as exc:
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(exc)
+            raise
         else:
-            if self.holding_reg:
-                new_val = await self._read_holding_reg(
-                    self.holding_reg, self.number_of_decimals
-                )
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+        finally:
+            # Cancelled (the bus was closed or the drain timed out), the
+            # writers must not wait forever
+            for future in waiters:
+                if not future.done():
+                    future.cancel()
+
+    async def write_registers(self, writes):
+        """Write (actuator, value) pairs using as few transactions as possible"""
+        writes = list(writes)
+        spans = []
+        for actuator, value in sorted(writes, key=lambda w: w[0].holding_reg):
+            if spans and spans[-1][-1][0].holding_reg == actuator.holding_reg - 1:
+                spans[-1].append((actuator, value))
             else:
-                new_val = await self._read_input_reg(
-                    self.input_reg, self.number_of_decimals
-                )
+                spans.append([(actuator, value)])
 
-        self.value = new_val
+        # Spans are written in the order of the caller
+        order = {id(actuator): idx for idx, (actuator, _) in enumerate(writes)}
+        spans.sort(key=lambda span: min(order[id(actuator)] for actuator, _ in span))
 
-        if self.value_mapping:
-            if new_val is None:
-                return None
-            
-            try:
-                self.value = self.value_mapping[new_val]
-            except KeyError:
-                _LOGGER.warning(
-                    "Unable to map value [%s] for %s" % (str(new_val), self.alias)
-                )
-                self.value = None
+        for span in spans:
+            if not await self._write_span(span) and len(span) > 1:
+                # Write the registers one by one to find the refused one
+                for write in span:
+                    await self._write_span([write])
 
-    async def _read_input_reg(self, adress, number_of_decimals=0):
-        while self.retry >= 1:
+    async def _write_span(self, span):
+        actuators = [actuator for actuator, _ in span]
+        try:
+            raw = [
+                encode_value(value, actuator.number_of_decimals, signed=True)
+                for actuator, value in span
+            ]
+        except ValueError:
+            _LOGGER.error("Value out of range for %s" % actuators[0].alias)
+            return False
+
+        start = time.monotonic()
+        retry = self.retry_attempts
+        while retry >= 1:
             try:
-                await modbus_lock.acquire()
-                ret = await self.mb_client.read_register(
-                    adress - 1,
-                    functioncode=4,
-                    signed=True,
-                    number_of_decimals=number_of_decimals,
+                await self.transactions.write_registers(
+                    actuators[0].holding_reg - 1, raw
                 )
-                self.retry = self.retry_attempts
-                return ret
+                self.transactions.metrics.write_latency.add(time.monotonic() - start)
+                break
             except SlaveReportedException:
-                self.retry = 0
-                _LOGGER.warning("Disabled %s - not supported" % self.alias)
+                if len(span) == 1:
+                    actuators[0].fail(permanent=True)
+                return False
             except ModbusException:
-                self.retry -= 1
-            finally:
-                modbus_lock.release()
+                retry -= 1
+                if retry >= 1:
+                    await self.transactions.backoff(self.retry_attempts - retry)
+        else:
+            _LOGGER.warning("Writing %s failed" % actuators[0].alias)
+            return False
+
+        for actuator, value in span:
+            actuator.written(value)
+        return True
 
 
-        if self.retry == 0:
-            self.retry = -1
-            _LOGGER.warning("Disabled %s - unresponsive" % self.alias)
+class ModbusBus:
+    """Orders all Modbus transactions towards one serial port (or gateway).
 
+    All DucoBoxes (slaves) on the port share the client and the queue. Writes
+    are served before queued (background) reads; within a priority the slaves
+    take turns, so a box with a large poll plan can not starve the others.
+    Clients which support pipelining (max_outstanding) get several
+    transactions in flight.
+    """
 
-    async def _read_holding_reg(self, adress, number_of_decimals=0):
-        while self.retry >= 1:
+    def __init__(self, name, client=None, timing: LinkTiming | None = None):
+        self.name = name
+        self.client = client
+        self.timing = timing if timing else LinkTiming(9600)
+        self._queue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers = []
+        # Transactions sent and not answered yet
+        self._in_flight = 0
+        self._connecting = asyncio.Lock()
+        # DucoBoxes using the bus, see acquire_bus
+        self.users = 0
+        # Next turn per slave adress and the turn being served
+        self._turns = {}
+        self._turn = 0
+
+    async def connect(self, client_factory):
+        """Open the connection of the port once, returns the client"""
+        async with self._connecting:
+            if self.client is None:
+                client = client_factory()
+                client.frame_gap = self.timing.frame_gap
+                await client.connect()
+                self.client = client
+        return self.client
+
+    async def submit(self, channel, priority, func, *args, **kwargs):
+        """Queue a transaction of a slave and wait for its result"""
+        loop = asyncio.get_running_loop()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < getattr(self.client, "max_outstanding", 1):
+            self._workers.append(loop.create_task(self._run()))
+
+        turn = max(self._turns.get(channel.slave_adr, 0), self._turn)
+        self._turns[channel.slave_adr] = turn + 1
+
+        future = loop.create_future()
+        self._queue.put_nowait(
+            (
+                priority,
+                turn,
+                next(self._sequence),
+                future,
+                loop.time(),
+                channel,
+                func,
+                args,
+                kwargs,
+            )
+        )
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, turn, _, future, queued, channel, func, args, kwargs = (
+                await self._queue.get()
+            )
+            if future.done():
+                # caller gave up waiting
+                continue
+            self._turn = max(self._turn, turn)
+            channel.metrics.queue_wait.add(loop.time() - queued)
             try:
-                await modbus_lock.acquire()
-                ret = await self.mb_client.read_register(
-                    adress - 1,
-                    functioncode=3,
-                    signed=True,
-                    number_of_decimals=number_of_decimals,
-                )
-                self.retry = self.retry_attempts
+                result = await self._execute(channel, func, *args, **kwargs)
+            except asyncio.CancelledError:
+                # The bus is closed, the caller must not wait forever
+                future.cancel()
+                raise
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    def cancel(self, channel):
+        """Cancel the queued transactions of one slave"""
+        kept = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item[5] is channel:
+                item[3].cancel()
+            else:
+                kept.append(item)
+        for item in kept:
+            self._queue.put_nowait(item)
+
+    async def close(self):
+        """Stop the workers, cancel all pending transactions and disconnect"""
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        while not self._queue.empty():
+            future = self._queue.get_nowait()[3]
+            future.cancel()
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    async def _execute(self, channel, func, registeraddress, *args, **kwargs):
+        """Run one transaction with the timeout tuned for the addressed module
+
+        The timeout is passed per transaction, pipelined transactions each
+        have their own. Only transactions which were not queued behind
+        others at the gateway are latency samples.
+        """
+        adr = (channel.slave_adr, module_base_adr(registeraddress))
+        sample = self._in_flight == 0
+
+        metrics = channel.metrics
+        metrics.count("frames")
+        start = time.monotonic()
+        self._in_flight += 1
+        try:
+            result = await func(
+                registeraddress,
+                *args,
+                slave_adr=channel.slave_adr,
+                timeout=self.timing.timeout(adr),
+                **kwargs,
+            )
+        except SlaveReportedException:
+            # the module did answer
+            metrics.count("exceptions")
+            if sample:
+                self.timing.record(adr, time.monotonic() - start)
+            raise
+        except NoResponseError:
+            metrics.count("timeouts")
+            self.timing.record_failure(adr)
+            raise
+        except ModbusException:
+            # corrupt response: CRC, length, adress or function code
+            metrics.count("crc_errors")
+            self.timing.record_failure(adr)
+            raise
+        finally:
+            self._in_flight -= 1
+
+        if sample:
+            self.timing.record(adr, time.monotonic() - start)
+        return result
+
+
+def port_name(transport, serial_port, host=None, tcp_port=DEFAULT_TCP_PORT):
+    """Serial port or host:port of the gateway"""
+    if transport == TRANSPORT_SERIAL:
+        return serial_port
+    return "%s:%d" % (host, tcp_port)
+
+
+# Shared buses per port name
+buses = {}
+
+
+def acquire_bus(name, baudrate=9600) -> ModbusBus:
+    """Get the bus of a port, every acquire needs a release_bus"""
+    if name not in buses:
+        buses[name] = ModbusBus(name, timing=LinkTiming(baudrate))
+    elif buses[name].timing.char_time != 11 / baudrate:
+        _LOGGER.warning("%s is already in use with another baudrate" % name)
+    bus = buses[name]
+    bus.users += 1
+    return bus
+
+
+async def release_bus(bus: ModbusBus):
+    """Release a bus, the last user closes the port"""
+    bus.users -= 1
+    if bus.users > 0:
+        return
+
+    if buses.get(bus.name) is bus:
+        del buses[bus.name]
+    _LOGGER.debug("Closing %s" % bus.name)
+    await bus.close()
+
+
+class ModbusTransactionQueue:
+    """Transactions of one DucoBox (slave adress) on a shared ModbusBus.
+
+    Exposes the register access methods of the modbus client, each call is a
+    single transaction on the bus. Keeps the metrics and the pending writes
+    of the slave.
+    """
 
-                return ret
-            except SlaveReportedException:
-                self.retry = 0
-                _LOGGER.warning("Disabled sensor %s - not supported" % self.alias)
-            except ModbusException:
-                self.retry -= 1
-            finally:
-                modbus_lock.release()
+    def __init__(self, bus: ModbusBus, slave_adr=1):
+        self.bus = bus
+        self.slave_adr = slave_adr
+        self.metrics = BusMetrics()
+        self.writes = WritePipeline(self)
 
+    @property
+    def name(self):
+        return "%s slave %d" % (self.bus.name, self.slave_adr)
 
     @property
-    def enabled(self):
-        return self.retry > 0
+    def client(self):
+        return self.bus.client
 
-    def __str__(self):
-        return "%s: %s" % (self.alias, str(self.value))
+    @property
+    def timing(self):
+        return self.bus.timing
 
+    @property
+    def frames(self):
+        return self.metrics.totals["frames"]
 
-class GenericActuator(GenericSensor):
-    """Generic class to write a setting to the instrument."""
+    @property
+    def failures(self):
+        return self.metrics.totals["timeouts"] + self.metrics.totals["crc_errors"]
+
+    def p99(self, base_adr):
+        """Observed p99 response latency of a module of this slave"""
+        return self.timing.p99((self.slave_adr, base_adr))
+
+    async def backoff(self, failures):
+        """Wait before retrying a failed transaction"""
+        self.metrics.count("retries")
+        await asyncio.sleep(self.timing.backoff(failures))
+
+    async def read_register(self, *args, priority=PRIORITY_READ, **kwargs):
+        return await self.bus.submit(
+            self, priority, self.client.read_register, *args, **kwargs
+        )
+
+    async def read_registers(self, *args, priority=PRIORITY_READ, **kwargs):
+        return await self.bus.submit(
+            self, priority, self.client.read_registers, *args, **kwargs
+        )
+
+    async def write_register(self, *args, priority=PRIORITY_WRITE, **kwargs):
+        return await self.bus.submit(
+            self, priority, self.client.write_register, *args, **kwargs
+        )
+
+    async def write_registers(self, *args, priority=PRIORITY_WRITE, **kwargs):
+        return await self.bus.submit(
+            self, priority, self.client.write_registers, *args, **kwargs
+        )
+
+class RegisterSpec:
+    """Description of one register of a module type.
+
+    The specs are declared once per module type (see DucoDevice.register_map)
+    and shared by all modules of that type, the per module state is kept in a
+    GenericSensor.
+    """
+
+    __slots__ = (
+        "name",
+        "offset",
+        "holding",
+        "writable",
+        "number_of_decimals",
+        "min_value",
+        "max_value",
+        "step_value",
+        "value_mapping",
+        "reverse_mapping",
+        "refresh",
+    )
 
     def __init__(
         self,
-        modbus_client,
-        module,
         name,
-        holding_reg,
+        offset,
+        holding=False,
+        writable=False,
         number_of_decimals=0,
         min_value=0,
         max_value=100,
         step_value=1,
         value_mapping=None,
+        refresh=REFRESH_FAST,
     ):
-        super().__init__(
-            modbus_client=modbus_client,
-            module=module,
-            name=name,
-            holding_reg=holding_reg,
-            input_reg=None,
-            number_of_decimals=number_of_decimals,
-            value_mapping=value_mapping,
-        )
+        self.name = name
+        self.offset = offset
+        self.holding = holding
+        self.writable = writable
+        self.number_of_decimals = number_of_decimals
         self.min_value = min_value
         self.max_value = max_value
         self.step_value = step_value
+        self.value_mapping = value_mapping
         self.reverse_mapping = None
         if value_mapping:
             self.reverse_mapping = {v: k for k, v in value_mapping.items()}
+        self.refresh = refresh
+
+    def create(self, modbus_client, module):
+        """Create the sensor (or actuator) of this register for a module"""
+        sensor_class = GenericActuator if self.writable else GenericSensor
+        return sensor_class(modbus_client, module, self)
+
+    def __repr__(self):
+        return "<%s %s %d>" % (
+            "holding" if self.holding else "input",
+            self.name,
+            self.offset,
+        )
 
-    async def write(self, value):
+
+def sensor_register(
+    name,
+    input_reg=None,
+    holding_reg=None,
+    number_of_decimals=0,
+    value_mapping=None,
+    refresh=REFRESH_FAST,
+):
+    """Read only register, the register is the offset to the base adress"""
+    return RegisterSpec(
+        name,
+        holding_reg if input_reg is None else input_reg,
+        holding=input_reg is None,
+        number_of_decimals=number_of_decimals,
+        value_mapping=value_mapping,
+        refresh=refresh,
+    )
+
+
+def actuator_register(
+    name,
+    holding_reg,
+    number_of_decimals=0,
+    min_value=0,
+    max_value=100,
+    step_value=1,
+    value_mapping=None,
+    refresh=REFRESH_SLOW,
+):
+    """Writable holding register, the register is the offset to the base adress"""
+    return RegisterSpec(
+        name,
+        holding_reg,
+        holding=True,
+        writable=True,
+        number_of_decimals=number_of_decimals,
+        min_value=min_value,
+        max_value=max_value,
+        step_value=step_value,
+        value_mapping=value_mapping,
+        refresh=refresh,
+    )
+
+
+def merge_registers(*register_groups):
+    """Combine register groups, the first register with a name wins"""
+    registers = {}
+    for group in register_groups:
+        for spec in group:
+            registers.setdefault(spec.name, spec)
+    return tuple(registers.values())
+
+
+class GenericSensor:
+    """Generic class to read a setting from the instrument.
+
+    Only the state of the register is stored here, the description of the
+    register is the (shared) RegisterSpec.
+    """
+
+    __slots__ = (
+        "spec",
+        "mb_client",
+        "module",
+        "value",
+        "health",
+        "last_poll",
+        "alias",
+        "history",
+        "subscribers",
+    )
+
+    retry_attempts = 5
+
+    def __init__(self, modbus_client, module, spec: RegisterSpec):
+        self.spec = spec
+        self.mb_client = modbus_client
+        self.module = module
+        self.value = None
+        self.health = Health()
+        self.last_poll = None
+        # Number of enabled entities showing this sensor
+        self.subscribers = 0
+        # Only numeric values have statistics
+        self.history = None if spec.value_mapping else ValueHistory()
+
+        self.alias = "%s @adr %s %s %d" % (
+            self.module.name,
+            self.module.device_id,
+            spec.name,
+            self.register,
+        )
+
+    @property
+    def name(self):
+        return self.spec.name
+
+    @property
+    def register(self):
+        return self.module.base_adr + self.spec.offset
+
+    @property
+    def holding_reg(self):
+        return self.register if self.spec.holding else None
+
+    @property
+    def input_reg(self):
+        return None if self.spec.holding else self.register
+
+    @property
+    def functioncode(self):
+        return 3 if self.spec.holding else 4
+
+    @property
+    def number_of_decimals(self):
+        return self.spec.number_of_decimals
+
+    @property
+    def value_mapping(self):
+        return self.spec.value_mapping
+
+    @property
+    def refresh(self):
+        return self.spec.refresh
+
+    def subscribe(self):
+        """An entity showing this sensor was added"""
+        self.subscribers += 1
+
+    def unsubscribe(self):
+        """An entity showing this sensor was removed (or disabled)"""
+        self.subscribers -= 1
+
+    async def update(self, priority=PRIORITY_READ):
+        """Read the register on its own, returns False when the read failed
+
+        A quarantined sensor is probed with a single attempt.
+        """
+        attempts = 1 if self.health.quarantined else self.retry_attempts
+        for attempt in range(attempts):
+            if self.module.tripped:
+                # Not the fault of the sensor, the module is unreachable
+                return False
+            if attempt:
+                await self.mb_client.backoff(attempt)
+            try:
+                values = await self.mb_client.read_registers(
+                    self.register - 1,
+                    1,
+                    functioncode=self.functioncode,
+                    priority=priority,
+                )
+            except SlaveReportedException:
+                self.module.responded()
+                self.fail(permanent=True)
+                return False
+            except ModbusException as exc:
+                self.module.failed(exc)
+                continue
+
+            self.module.responded()
+            self.set_raw(values[0])
+            return True
+
+        if not self.module.tripped:
+            self.fail()
+        return False
+
+    def set_raw(self, raw):
+        """Decode a raw (unsigned) register value obtained by a block read."""
+        if self.health.success():
+            _LOGGER.info("Re-enabled %s" % self.alias)
+        self._set_value(decode_value(raw, self.number_of_decimals, signed=True))
+        self._record()
+
+    def fail(self, permanent=False):
+        """Register a failed read, permanent when the register is not supported"""
+        if self.health.failure(permanent):
+            self.value = None
+            _LOGGER.warning(
+                "Quarantined %s - %s"
+                % (self.alias, "not supported" if permanent else "unresponsive")
+            )
+
+    def _record(self):
+        """Add the value read from the bus to the history"""
+        if self.history is not None and self.value is not None:
+            self.history.add(self.value)
+
+    def _set_value(self, new_val):
+        self.value = new_val
+
+        if self.value_mapping:
+            if new_val is None:
+                return None
+            
+            try:
+                self.value = self.value_mapping[new_val]
+            except KeyError:
+                _LOGGER.warning(
+                    "Unable to map value [%s] for %s" % (str(new_val), self.alias)
+                )
+                self.value = None
+
+    @property
+    def enabled(self):
+        return not self.health.quarantined and not self.module.tripped
+
+    def __str__(self):
+        return "%s: %s" % (self.alias, str(self.value))
+
+
+class GenericActuator(GenericSensor):
+    """Generic class to write a setting to the instrument."""
+
+    __slots__ = ()
+
+    @property
+    def min_value(self):
+        return self.spec.min_value
+
+    @property
+    def max_value(self):
+        return self.spec.max_value
+
+    @property
+    def step_value(self):
+        return self.spec.step_value
+
+    @property
+    def reverse_mapping(self):
+        return self.spec.reverse_mapping
+
+    def to_register(self, value):
+        """Map a value to the register value, None when it is not mapped"""
         if self.reverse_mapping:
             if not value in self.reverse_mapping:
                 _LOGGER.error(
                     "%s not present in value mapping for %s" % (str(value), self.name)
                 )
-                return
+                return None
             value = self.reverse_mapping[value]
+        return value
+
+    async def write(self, value):
+        value = self.to_register(value)
+        if value is None:
+            return
         _LOGGER.info("Writing %d to adress %d"%(value, self.holding_reg))
-        if not SIMULATION_MODE:
-            try:
-                await modbus_lock.acquire()
-                await self._write_holding_reg(
-                    self.holding_reg, value, number_of_decimals=self.number_of_decimals
-                )
-            finally:
-                modbus_lock.release()
-        await self.update()
+        await self.mb_client.writes.write(self, value)
+
+    def written(self, value):
+        """Show the written value until the next read confirms it"""
+        self.health.success()
+        self._set_value(value)
+        self.last_poll = None
+
+
+# Outcome of a block read
+BLOCK_READ = "read"
+# The slave answered with an exception response, e.g. unsupported registers
+BLOCK_REFUSED = "refused"
+# No valid response within the retries (or the circuit breaker opened)
+BLOCK_FAILED = "failed"
+
+
+class RegisterBlock:
+    """Span of registers of one module fetched in a single transaction."""
+
+    def __init__(self, module, functioncode, start):
+        self.module = module
+        self.functioncode = functioncode
+        self.start = start
+        self.end = start
+        self.sensors = []
+
+    @property
+    def count(self):
+        return self.end - self.start + 1
+
+    @property
+    def has_gaps(self):
+        return len({sens.register for sens in self.sensors}) < self.count
 
-    async def _write_holding_reg(self, adress, value, number_of_decimals=0):
-        while self.retry >= 1:
+    def add(self, sensor: GenericSensor):
+        self.sensors.append(sensor)
+        self.end = max(self.end, sensor.register)
+
+    def distribute(self, values):
+        """Fan the registers returned by read_registers out to the sensors."""
+        for sens in self.sensors:
+            sens.set_raw(values[sens.register - self.start])
+
+    async def read(self, transactions, retry_attempts=5, priority=PRIORITY_READ):
+        """Read the block, returns BLOCK_READ, BLOCK_REFUSED or BLOCK_FAILED."""
+        retry = retry_attempts
+        while retry >= 1 and not self.module.tripped:
             try:
-                ret = await self.mb_client.write_register(
-                    adress - 1,
-                    value,
-                    functioncode=16,
-                    signed=True,
-                    number_of_decimals=number_of_decimals,
+                values = await transactions.read_registers(
+                    self.start - 1,
+                    self.count,
+                    functioncode=self.functioncode,
+                    priority=priority,
                 )
-                self.retry = self.retry_attempts 
-                return ret
+                self.module.responded()
+                self.distribute(values)
+                return BLOCK_READ
             except SlaveReportedException:
-                self.retry = 0
-                _LOGGER.warning("Disabled actuator %s - not supported" % self.alias)
-            except ModbusException:
-                self.retry -= 1
-       
+                self.module.responded()
+                return BLOCK_REFUSED
+            except ModbusException as exc:
+                self.module.failed(exc)
+                retry -= 1
+                if retry >= 1 and not self.module.tripped:
+                    await transactions.backoff(retry_attempts - retry)
+
+        return BLOCK_FAILED
+
+    def __str__(self):
+        return "FC%d %d..%d (%d sensors)" % (
+            self.functioncode,
+            self.start,
+            self.end,
+            len(self.sensors),
+        )
+
+
+def plan_register_blocks(module, sensors, max_gap=MAX_BLOCK_GAP):
+    """Group the registers of a module into as few block reads as possible.
+
+    Input and holding registers are planned separately (function code 4 and 3),
+    a new block is started when the distance to the previous register exceeds
+    max_gap.
+    """
+    blocks = []
+    for functioncode in (4, 3):
+        block = None
+        regs = sorted(
+            (sens for sens in sensors if sens.functioncode == functioncode),
+            key=lambda sens: sens.register,
+        )
+        for sens in regs:
+            if block is None or sens.register - block.end - 1 > max_gap:
+                block = RegisterBlock(module, functioncode, sens.register)
+                blocks.append(block)
+            block.add(sens)
+
+    return blocks
+
+
 class DucoBoxBase:
     """
     DucoBoxBase initializes all connected valves/devices
     Creates a list of all sensors [GenericSensor|GenericActuator]
     """
 
-    def __init__(self, serial_port, baudrate=9600, slave_adr=1, simulate=False):
+    def __init__(
+        self,
+        serial_port,
+        baudrate=9600,
+        slave_adr=1,
+        simulate=False,
+        transport=TRANSPORT_SERIAL,
+        host=None,
+        tcp_port=DEFAULT_TCP_PORT,
+    ):
         self.simulate = simulate
         self.retry_attempts = 5
         self.retry = self.retry_attempts
@@ -250,28 +1184,119 @@ class DucoBoxBase:
         self.serial_port = serial_port
         self.baudrate = baudrate
         self.slave_adr = slave_adr
+        self.transport = transport
+        self.host = host
+        self.tcp_port = tcp_port
         self.mb_client = None
+        # The bus is released by close()
+        self.transactions = ModbusTransactionQueue(
+            acquire_bus(self.port_name, baudrate), slave_adr
+        )
+        self.released = False
+        # Prefix of the device ids, the config entry id in Homeassistant
+        self.namespace = self.transactions.name
+        self.poll_cycle = 0
+        # Start of the current poll cycle, the time stamp of its reads
+        self.poll_time = time.monotonic()
+        self.module_addresses = module_addresses
+        # Periodic rescans must not overlap
+        self._rescanning = asyncio.Lock()
+        # Publish filters per sensor name and the published values per alias
+        self.deadbands = deadbands_from_options({})
+        self.published = {}
+        # Only poll the sensors with subscribers (enabled entities)
+        self.demand_driven = False
 
         if simulate:
-            global SIMULATION_MODE
-            SIMULATION_MODE = True
-
+            # The simulator has a module of every type
+            self.module_addresses = range(10, 10 * (len(ducobox_modules) + 1), 10)
             _LOGGER.info("Running in simulation mode")
 
     async def create_serial_connection(self):
+        """Connect to the port, shared with the other boxes on the same port"""
+        bus = self.transactions.bus
+        timeout = bus.timing.default_timeout
         if self.simulate:
-            await asyncio.sleep(0.01)
-            return
+            try:
+                from .simulator import SimulatedRtuClient, get_simulated_bus
+            except ImportError:
+                from simulator import SimulatedRtuClient, get_simulated_bus
+
+            simulated_bus = get_simulated_bus(self.port_name, self.baudrate)
+            simulated_bus.add_device(self.slave_adr)
+
+            def client_factory():
+                return SimulatedRtuClient(
+                    simulated_bus,
+                    self.slave_adr,
+                    baudrate=self.baudrate,
+                    timeout=timeout,
+                )
+
+        elif self.transport == TRANSPORT_TCP:
+
+            def client_factory():
+                return ModbusTcpClient(
+                    self.host,
+                    self.tcp_port,
+                    self.slave_adr,
+                    baudrate=self.baudrate,
+                    timeout=timeout,
+                )
+
+        elif self.transport == TRANSPORT_RTU_OVER_TCP:
+
+            def client_factory():
+                return ModbusRtuOverTcpClient(
+                    self.host,
+                    self.tcp_port,
+                    self.slave_adr,
+                    baudrate=self.baudrate,
+                    timeout=timeout,
+                )
+
+        else:
+
+            def client_factory():
+                return ModbusRtuClient(
+                    self.serial_port,
+                    self.slave_adr,
+                    baudrate=self.baudrate,
+                    timeout=timeout,
+                )
 
         try:
-            mb_client = AsyncioInstrument(
-                self.serial_port, self.slave_adr, mode=MODE_RTU
-            )  # port name, slave address (in decimal)
-            mb_client.serial.timeout = 0.1  # sec
-            mb_client.serial.baudrate = self.baudrate
-            self.mb_client = mb_client
+            self.mb_client = await bus.connect(client_factory)
         except Exception:
-            _LOGGER.error(f"Failed to open serial port {self.serial_port}")
+            _LOGGER.error(f"Failed to open {self.port_name}")
+
+    async def close(self):
+        """Stop using the bus
+
+        Pending writes are still sent (within WRITE_DRAIN_TIMEOUT), queued reads
+        are cancelled and the bus is released; the port is closed when no other
+        box uses it.
+        """
+        if self.released:
+            return
+        self.released = True
+
+        try:
+            await asyncio.wait_for(
+                self.transactions.writes.drain(), WRITE_DRAIN_TIMEOUT
+            )
+        except (asyncio.TimeoutError, ModbusException):
+            _LOGGER.warning("Pending writes to %s are lost" % self.port_name)
+
+        bus = self.transactions.bus
+        bus.cancel(self.transactions)
+        self.mb_client = None
+        await release_bus(bus)
+
+    @property
+    def port_name(self):
+        """Serial port or host:port of the gateway"""
+        return port_name(self.transport, self.serial_port, self.host, self.tcp_port)
 
     def add_sensor(self, sensor: GenericSensor):
         self.sensors.append(sensor)
@@ -279,567 +1304,616 @@ class DucoBoxBase:
     def detected(self):
         return len(self.modules) > 0
 
-    async def _simulate_modules(self):
-        """In simulation mode, load a module of each type"""
+    async def _probe_module(self, adr):
+        """Read the module type code at a base adress"""
+        retry = self.retry_attempts
+        while retry >= 1:
+            try:
+                return await self.transactions.read_register(
+                    adr - 1, functioncode=4, signed=True
+                )
+            except SlaveReportedException:
+                return None
+            except ModbusException:
+                retry -= 1
+                if retry >= 1:
+                    await self.transactions.backoff(self.retry_attempts - retry)
+
+        return MODULE_UNREACHABLE
+
+    async def probe_modules(self):
+        """Read the type codes of all module adresses: {adress: type code}
+
+        The type code is None when the box reports no module on the adress and
+        MODULE_UNREACHABLE when the box did not answer.
+        """
+        # All probes are queued at once, the transaction queue sends them
+        # back to back.
+        type_codes = await asyncio.gather(
+            *[self._probe_module(adr) for adr in self.module_addresses]
+        )
+        return dict(zip(self.module_addresses, type_codes))
+
+    def create_module(self, adr, type_code):
+        """Create the module object of a type code without bus access"""
+        mod = ducobox_modules[type_code][0](self.transactions, adr, self.namespace)
+        mod.type_code = type_code
+        return mod
+
+    def set_namespace(self, namespace):
+        """Move the modules (and their device ids) into another namespace"""
+        self.namespace = namespace
+        self.modules = self.build_modules(self.discovery_result())
+
+    def discovery_result(self, modules=None):
+        """Describe the detected modules as (adress, type code, sensor names)"""
+        if modules is None:
+            modules = self.modules
+
+        return [
+            (mod.base_adr, mod.type_code, [sens.name for sens in mod.sensors])
+            for mod in modules
+        ]
 
-        adr = 10
-        for code, duco_mod in ducobox_modules.items():
-            mod = duco_mod[0](mb_client=self.mb_client, base_adr=adr)
+    def build_modules(self, discovery):
+        """Create the module objects of a discovery result without bus access"""
+        modules = []
+        for adr, type_code, sensor_names in discovery:
+            mod = self.create_module(adr, type_code)
+            mod.sensors = [sens for sens in mod.sensors if sens.name in sensor_names]
+            modules.append(mod)
+
+        return modules
+
+    def export_topology(self, modules=None):
+        """Serializable description of the detected modules"""
+        return {
+            "modules": [
+                {"adr": adr, "type_code": type_code, "sensors": sensor_names}
+                for adr, type_code, sensor_names in self.discovery_result(modules)
+            ]
+        }
+
+    def load_topology(self, topology):
+        """Restore the modules from a topology created by export_topology"""
+        discovery = [
+            (mod["adr"], mod["type_code"], mod["sensors"])
+            for mod in topology["modules"]
+            if mod["type_code"] in ducobox_modules
+        ]
+        self.modules = self.build_modules(discovery)
 
-            print(adr, str(duco_mod[0]), mod, mod.name)
-            print("\r\n".join([str(sens) for sens in mod.sensors]))
+    async def detect_modules(self):
+        """Probe the bus and return the detected modules
 
-            self.modules.append(mod)
-            self.sensors += mod.sensors
-            adr += 10
+        Does not touch self.modules, so it can be used to verify a restored
+        topology while the entities are running.
+        """
+        modules = []
+        for adr, type_code in (await self.probe_modules()).items():
+            if type_code in ducobox_modules:
+                _LOGGER.info(
+                    "Detected %s on adress %d" % (ducobox_modules[type_code][1], adr)
+                )
+                modules.append(self.create_module(adr, type_code))
+
+        await self.probe_sensors(modules)
+
+        return modules
+
+    async def probe_sensors(self, modules):
+        """Read the sensors of new modules and drop the ones the box refuses
+
+        Only the sensors which survive are part of the topology, sensors
+        which time out are kept (and quarantined at runtime).
+        """
+        await asyncio.gather(*[self.update_module(mod) for mod in modules])
+        for mod in modules:
+            mod.sensors = [sens for sens in mod.sensors if not sens.health.quarantined]
+
+    async def reconcile_sensors(self, modules):
+        """Compare the sensors of known modules with the bus: (added, removed)
+
+        The full register map of every module is probed. Sensors which the box
+        supports now are added to the module, sensors it refuses are removed.
+        Modules which (partly) time out are left as they are.
+        """
+        added, removed = [], []
+        for mod in modules:
+            if mod.tripped:
+                continue
+            probe = self.create_module(mod.base_adr, mod.type_code)
+            await self.probe_sensors([probe])
+            if probe.tripped or any(sens.health.failures for sens in probe.sensors):
+                continue
+
+            supported = {sens.name for sens in probe.sensors}
+            sensors = [
+                sens for sens in mod.sensors_by_name.values() if sens.name in supported
+            ]
+            for sens in sensors:
+                if sens not in mod.sensors:
+                    _LOGGER.info("Detected %s" % sens.alias)
+                    sens.health = Health()
+                    sens.last_poll = None
+                    added.append(sens)
+            for sens in mod.sensors:
+                if sens not in sensors:
+                    _LOGGER.info("%s is no longer supported" % sens.alias)
+                    removed.append(sens)
+            mod.sensors = sensors
+
+        return added, removed
+
+    async def rescan(self):
+        """Probe the bus for added and removed modules: (added, removed)
+
+        Modules of unchanged adresses keep their objects (and entities). A
+        module is only removed when the box reports no module or a module of
+        another type on its adress, modules which do not answer are left to
+        their circuit breaker.
+        """
+        async with self._rescanning:
+            type_codes = await self.probe_modules()
+
+            current = {mod.base_adr: mod for mod in self.modules}
+            added, removed = [], []
+            for adr, type_code in type_codes.items():
+                if type_code == MODULE_UNREACHABLE:
+                    continue
+                mod = current.get(adr)
+                if mod is not None and mod.type_code != type_code:
+                    _LOGGER.info("Module on adress %d removed" % adr)
+                    removed.append(mod)
+                    mod = None
+                if mod is None and type_code in ducobox_modules:
+                    _LOGGER.info(
+                        "Detected %s on adress %d"
+                        % (ducobox_modules[type_code][1], adr)
+                    )
+                    added.append(self.create_module(adr, type_code))
 
-        # sort sensors based on alias
-        # self.sensor_alias =
-        # self.sensor_alias.sort()
+            await self.probe_sensors(added)
 
-        # print("\r\n".join(self.sensor_alias))
-        await asyncio.sleep(0.01)
+            if added or removed:
+                self.modules = sorted(
+                    [mod for mod in self.modules if mod not in removed] + added,
+                    key=lambda mod: mod.base_adr,
+                )
+
+            return added, removed
 
     async def scan_modules(self):
         """Scan all connected modules"""
-        if self.simulate:
-            await self._simulate_modules()
-            return
-    
         if self.mb_client is None:
             _LOGGER.warning("Serial port not connected!")
             return
 
-        self.modules = []
-        for adr in range(10, 90, 10):
-            resp = None
-            while self.retry > 1:
-                try:
-                    resp = await self.mb_client.read_register(
-                        adr - 1, functioncode=4, signed=True
-                    )
-                    break
-                except SlaveReportedException:
-                    self.retry = 0
-                except ModbusException:
-                    self.retry -= 1
-            if resp in ducobox_modules:
-                _LOGGER.info(
-                    "Detected %s on adress %d" % (ducobox_modules[resp][1], adr)
-                )
-                mod = ducobox_modules[resp][0](self.mb_client, adr)
-                
-                for sens in mod.sensors:
-                    await sens.update()
-                    if not sens.enabled:
-                        print("removing %s"%sens)
-                        mod.sensors.remove(sens)
-                        
-                self.modules.append(mod)
+        self.modules = await self.detect_modules()
 
         if len(self.modules) == 0:
             raise DucoBoxException("No modules detected!")
-        
-        
-    async def update_sensors(self):
-        """Fetch all data from all sensors"""
 
-        for id, module in enumerate(self.modules):
+    async def _read_block(self, block: RegisterBlock):
+        """Read a register block, returns its outcome (see RegisterBlock.read)"""
+        return await block.read(self.transactions, self.retry_attempts)
+
+    def is_polled(self, sensor: GenericSensor):
+        """Check if the value of a sensor is used"""
+        return not self.demand_driven or sensor.subscribers > 0
+
+    def is_due(self, sensor: GenericSensor):
+        """Check if the refresh class of a sensor requires a read this cycle"""
+        if not self.is_polled(sensor):
+            return False
+
+        if sensor.health.quarantined:
+            # Only re-probed, see probe_quarantined
+            return False
+
+        if sensor.last_poll is None:
+            return True
+
+        period = refresh_periods[sensor.refresh]
+        if period is None:
+            return False
+
+        return self.poll_time - sensor.last_poll >= period
+
+    async def update_module(self, module, sensors=None):
+        """Fetch the sensors of a module using block reads"""
+
+        if sensors is None:
+            sensors = module.sensors
+
+        for block in plan_register_blocks(module, sensors, module.block_gap):
+            result = await self._read_block(block)
+            if result == BLOCK_READ:
+                for sensor in block.sensors:
+                    sensor.last_poll = self.poll_time
+                continue
+
+            if result == BLOCK_FAILED:
+                # The module did not answer, retrying per sensor would only
+                # multiply the timeouts
+                if module.tripped:
+                    return
+                for sensor in block.sensors:
+                    sensor.fail()
+                continue
+
+            if block.has_gaps:
+                # The slave refuses spans over unsupported registers,
+                # only read contiguous spans from now on.
+                _LOGGER.info(
+                    "Block read %s refused, disabling gap bridging for %s"
+                    % (block, module.name)
+                )
+                module.block_gap = 0
+
+            for sensor in block.sensors:
+                if module.tripped:
+                    return
+                if await sensor.update():
+                    sensor.last_poll = self.poll_time
+
+    async def probe_module(self, module):
+        """Probe the type register of a module with an open circuit breaker
+
+        Returns True when the module answered and its breaker is closed again.
+        """
+        if not module.breaker.probe_due():
+            return False
+
+        try:
+            await self.transactions.read_registers(
+                module.base_adr - 1, 1, functioncode=4, priority=PRIORITY_PROBE
+            )
+        except SlaveReportedException:
+            pass
+        except ModbusException as exc:
+            module.failed(exc)
+            return False
+
+        module.responded()
+        return True
+
+    async def probe_quarantined(self):
+        """Re-probe the quarantined sensors of which the back-off expired
+
+        Returns the sensors which recovered.
+        """
+        now = time.monotonic()
+        recovered = []
+        for module in self.modules:
+            if module.tripped:
+                continue
             for sensor in module.sensors:
-                await sensor.update()
+                if self.is_polled(sensor) and sensor.health.probe_due(now):
+                    if await sensor.update(PRIORITY_PROBE):
+                        sensor.last_poll = self.poll_time
+                        recovered.append(sensor)
+        return recovered
 
-                if not sensor.enabled:
-                    print("removing %s"%sensor)
-                    module.sensors.remove(sensor)
+    async def update_sensors(self):
+        """Fetch all sensors which are due according to their refresh class
+
+        In demand driven mode only the sensors with subscribers are polled.
+        Returns the change set of this cycle: {alias: value} of the sensors
+        of which the value changed beyond their deadband, and the bus metrics
+        which changed ({METRICS_PREFIX + key: value}).
+        """
+
+        self.poll_cycle += 1
+        self.poll_time = time.monotonic()
+        self.transactions.metrics.start_cycle()
+        changes = {}
+        for module in self.modules:
+            # The plan follows the subscriptions, modules of which no sensor
+            # is used are not touched (nor probed when tripped)
+            if not any(self.is_polled(sensor) for sensor in module.sensors):
+                continue
+
+            if module.tripped and not await self.probe_module(module):
+                continue
+
+            due = [sensor for sensor in module.sensors if self.is_due(sensor)]
+            if not due:
+                continue
+
+            await self.update_module(module, due)
+            now = time.monotonic()
+            for sensor in due:
+                if self.publish(sensor, now):
+                    changes[sensor.alias] = sensor.value
+
+        for sensor in await self.probe_quarantined():
+            if self.publish(sensor, time.monotonic()):
+                changes[sensor.alias] = sensor.value
+
+        # The breaker cleared all values of a module, not only the due ones
+        now = time.monotonic()
+        for module in self.modules:
+            if module.tripped:
+                for sensor in module.sensors:
+                    if self.publish(sensor, now):
+                        changes[sensor.alias] = sensor.value
+
+        self.transactions.metrics.end_cycle()
+        changes.update(self.transactions.metrics.changes(METRICS_PREFIX))
+        return changes
+
+    def published_value(self, sensor: GenericSensor):
+        """Value of a sensor as it passed its publish filter"""
+        published = self.published.get(sensor.alias)
+        return sensor.value if published is None else published[0]
+
+    def publish(self, sensor: GenericSensor, now):
+        """Check if the new value of a sensor passes its publish filter"""
+        if sensor.alias not in self.published:
+            # Values read by the discovery were never published
+            self.published[sensor.alias] = (sensor.value, now)
+            return True
+
+        value, since = self.published[sensor.alias]
+        if sensor.value == value:
+            return False
+
+        deadband = self.deadbands.get(sensor.name)
+        if deadband is not None and not deadband.exceeded(
+            value, sensor.value, now - since
+        ):
+            return False
+
+        self.published[sensor.alias] = (sensor.value, now)
+        return True
+
+
+# Registers shared by several module types, offsets to the base adress
+ACTION = actuator_register(
+    "action", 9, min_value=1, max_value=6, step_value=1, value_mapping=action_mapping
+)
+STATUS = sensor_register("status", input_reg=1, value_mapping=status_mapping)
+VENTILATION_LEVEL = sensor_register("ventilation level", input_reg=2)
+VENTILATION_SETPOINT = actuator_register(
+    "ventilation setpoint", 0, min_value=-1, max_value=100, step_value=5
+)
+# Not for batter powered sensor
+TEMPERATURE = sensor_register("temperature", input_reg=3, number_of_decimals=1)
+LOCALISATION_ID = sensor_register("localisation ID", input_reg=9, refresh=REFRESH_ONCE)
+
+GENERIC_SENSOR_REGISTERS = (
+    ACTION,
+    STATUS,
+    TEMPERATURE,
+    LOCALISATION_ID,
+    actuator_register("button 1", 4, min_value=0, max_value=100, step_value=5),
+    actuator_register("button 2", 5, min_value=0, max_value=100, step_value=5),
+    actuator_register("button 3", 6, min_value=0, max_value=100, step_value=5),
+    actuator_register("Manual Time", 7, min_value=5, max_value=9999, step_value=5),
+)
+
+CO2_REGISTERS = (
+    sensor_register("CO2 value", input_reg=4),
+    actuator_register("CO2 setpoint", 1, max_value=2000),
+)
+
+HUMIDITY_REGISTERS = (
+    sensor_register("humidity", input_reg=5, number_of_decimals=2),
+    actuator_register("humidity setpoint", 2),
+    actuator_register("humidity delta", 3),
+)
+
+VALVE_REGISTERS = (
+    ACTION,
+    actuator_register("auto min", 5, min_value=10, max_value=100, step_value=5),
+    actuator_register("auto max", 6),
+    LOCALISATION_ID,
+    STATUS,
+    VENTILATION_LEVEL,
+    TEMPERATURE,
+    VENTILATION_SETPOINT,
+    actuator_register("flow", 4),
+)
 
 
 class DucoDevice:
-    """Base class for all devices holds the sensors list."""
+    """Base class for all devices holds the sensors list.
 
-    def __init__(self, required_argument="sdf") -> None:
-        print("__init__ DucoDevice: " + str(required_argument))
-        self.sensors = []
-        self.sensors_by_name = {}
+    The registers of a module type are declared in register_map, the sensors
+    of a module are created from it.
+    """
 
-    def register_sensors(self, sensor_list : [GenericSensor]):
-        sens_names = [sens.name for sens in self.sensors]
+    block_gap = MAX_BLOCK_GAP
+    type_code = None
+    register_map = ()
 
-        for new_sens in sensor_list:
-            if not new_sens.name in sens_names:
-                self.sensors.append(new_sens)
-                self.sensors_by_name[new_sens.name] = new_sens
-            else:
-                print("%s already present" % new_sens.name)
-            
+    def __init__(
+        self,
+        mb_client: ModbusTransactionQueue | None,
+        base_adr: int,
+        namespace: str | None = None,
+    ) -> None:
+        self.base_adr = base_adr
+        slave_adr = getattr(mb_client, "slave_adr", 1)
+        # Adress shown in the device name
+        self.label = base_adr if slave_adr == 1 else "%d-%d" % (slave_adr, base_adr)
+        # Unique over all boxes: "<namespace of the box> <base adress>"
+        self.device_id = (
+            self.label if namespace is None else "%s %d" % (namespace, base_adr)
+        )
+        self.sensors = [spec.create(mb_client, self) for spec in self.register_map]
+        self.sensors_by_name = {sens.name: sens for sens in self.sensors}
+        # Circuit breaker, counts consecutive timeouts of the module
+        self.breaker = Health(BREAKER_TIMEOUTS)
 
-class DucoBox(DucoDevice):
-    name = "Master module"
+    @property
+    def tripped(self):
+        """The circuit breaker is open, the module is not polled"""
+        return self.breaker.quarantined
+
+    def responded(self):
+        """A transaction of this module got an answer"""
+        if self.breaker.success():
+            _LOGGER.info("%s @adr %d answers again" % (self.name, self.base_adr))
+            # Their values were cleared by the breaker, read them all again
+            for sens in self.sensors:
+                sens.last_poll = None
+
+    def failed(self, exc: ModbusException):
+        """A transaction of this module failed, opens the breaker on timeouts"""
+        if not isinstance(exc, NoResponseError):
+            return
+        if self.breaker.failure():
+            _LOGGER.warning(
+                "%s @adr %d unresponsive, only probing its type register"
+                % (self.name, self.base_adr)
+            )
+            for sens in self.sensors:
+                sens.value = None
 
-    def __init__(self, mb_client: AsyncioInstrument | None, base_adr: int) -> None:
-        DucoDevice.__init__(self)
-        self.base_adr = base_adr
+    @property
+    def health(self):
+        """Quarantined when the breaker is open or all sensors are, healthy
+        when all sensors are"""
+        if self.tripped:
+            return HEALTH_QUARANTINED
+        states = {sens.health.state for sens in self.sensors}
+        if states == {HEALTH_HEALTHY}:
+            return HEALTH_HEALTHY
+        if states == {HEALTH_QUARANTINED}:
+            return HEALTH_QUARANTINED
+        return HEALTH_DEGRADED
+
+    async def write_settings(self, values: dict):
+        """Write several settings at once: {sensor name: value}
+
+        The writes are sent in the given order, adjacent registers grouped in
+        one transaction, followed by a single read-back of all written
+        registers.
+        """
+        writes = []
+        for name, value in values.items():
+            actuator = self.sensors_by_name[name]
+            register_value = actuator.to_register(value)
+            if register_value is None:
+                return
+            writes.append((actuator, register_value))
 
-        sensors = [
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="action",
-                holding_reg=base_adr + 9,
-                min_value=1,
-                max_value=6,
-                step_value=1,
-                value_mapping=action_mapping,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="ventilation setpoint",
-                holding_reg=base_adr + 0,
-                min_value=-1,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="auto min",
-                holding_reg=base_adr + 5,
-                min_value=0,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="auto max",
-                holding_reg=base_adr + 6,
-                min_value=0,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="status",
-                input_reg=base_adr + 1,
-                value_mapping=status_mapping,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="ventilation level",
-                input_reg=base_adr + 2,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="power",
-                input_reg=base_adr + 3,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="average power",
-                input_reg=base_adr + 4,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="maximal power",
-                input_reg=base_adr + 5,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="localisation ID",
-                input_reg=base_adr + 9,
-            ),
-        ]
+        if not writes:
+            return
 
-        self.register_sensors(sensors)
+        transactions = writes[0][0].mb_client
+        await transactions.writes.write_now(writes)
 
+        actuators = [actuator for actuator, _ in writes]
+        for block in plan_register_blocks(self, actuators, self.block_gap):
+            await block.read(transactions, priority=PRIORITY_WRITE)
 
-class DucoGenericSensor:
-    name = "Generic sensor"
 
-    def __init__(
-        self, mb_client: AsyncioInstrument, base_adr: int, register_sensors=None
-    ) -> None:
-        self.base_adr = base_adr
+class DucoBox(DucoDevice):
+    name = "Master module"
 
-        sensors = [
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="action",
-                holding_reg=base_adr + 9,
-                min_value=1,
-                max_value=6,
-                step_value=1,
-                value_mapping=action_mapping,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="status",
-                input_reg=base_adr + 1,
-                value_mapping=status_mapping,
-            ),
-            # Not for batter powered sensor
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="temperature",
-                input_reg=base_adr + 3,
-                number_of_decimals=1,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="localisation ID",
-                input_reg=base_adr + 9,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="button 1",
-                holding_reg=base_adr + 4,
-                min_value=0,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="button 2",
-                holding_reg=base_adr + 5,
-                min_value=0,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="button 3",
-                holding_reg=base_adr + 6,
-                min_value=0,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="Manual Time",
-                holding_reg=base_adr + 7,
-                min_value=5,
-                max_value=9999,
-                step_value=5,
-            ),
-            
-        ]
+    register_map = (
+        ACTION,
+        VENTILATION_SETPOINT,
+        actuator_register("auto min", 5, min_value=0, max_value=100, step_value=5),
+        actuator_register("auto max", 6, min_value=0, max_value=100, step_value=5),
+        STATUS,
+        VENTILATION_LEVEL,
+        sensor_register("power", input_reg=3),
+        sensor_register("average power", input_reg=4),
+        sensor_register("maximal power", input_reg=5),
+        LOCALISATION_ID,
+    )
+
+
+class DucoGenericSensor(DucoDevice):
+    name = "Generic sensor"
 
-        if register_sensors:
-            register_sensors(sensors)
+    register_map = GENERIC_SENSOR_REGISTERS
 
 
-class DucoCO2Sensor(DucoGenericSensor, DucoDevice):
+class DucoCO2Sensor(DucoGenericSensor):
     name = "CO2 sensor"
 
-    def __init__(
-        self, mb_client: AsyncioInstrument, base_adr: int, register_sensors=None
-    ) -> None:
-        if register_sensors is None:
-            self.base_adr = base_adr
-            DucoDevice.__init__(self)
-            DucoGenericSensor.__init__(self, mb_client, base_adr, self.register_sensors)
-
-        sensors = [
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="CO2 value",
-                input_reg=base_adr + 4,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="CO2 setpoint",
-                max_value=2000,
-                holding_reg=base_adr + 1,
-            ),
-        ]
-
-        self.register_sensors(sensors)
+    register_map = merge_registers(GENERIC_SENSOR_REGISTERS, CO2_REGISTERS)
 
 
-class DucoHumSensor(DucoGenericSensor, DucoDevice):
+class DucoHumSensor(DucoGenericSensor):
     name = "Humidity sensor"
 
-    def __init__(
-        self, mb_client: AsyncioInstrument, base_adr: int, register_sensors=None
-    ) -> None:
-        if register_sensors is None:
-            self.base_adr = base_adr
-            DucoDevice.__init__(self)
-            DucoGenericSensor.__init__(self, mb_client, base_adr, self.register_sensors)
-
-        sensors = [
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="humidity",
-                input_reg=base_adr + 5,
-                number_of_decimals=2,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="humidity setpoint",
-                holding_reg=base_adr + 2,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="humidity delta",
-                holding_reg=base_adr + 3,
-            ),
-        ]
-
-        self.register_sensors(sensors)
+    register_map = merge_registers(GENERIC_SENSOR_REGISTERS, HUMIDITY_REGISTERS)
 
 
-class DucoValve:
+class DucoValve(DucoDevice):
     """Holding the generic parameters for a valve"""
 
     name = "Generic valve"
 
-    def __init__(
-        self, mb_client: AsyncioInstrument, base_adr: int, register_sensors=None
-    ) -> None:
-        print("DucoValve")
-        self.base_adr = base_adr
-        self.mb_client = mb_client
-
-        sensors = [
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="action",
-                holding_reg=base_adr + 9,
-                min_value=1,
-                max_value=6,
-                step_value=1,
-                value_mapping=action_mapping,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="auto min",
-                holding_reg=base_adr + 5,
-                min_value=10,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="auto max",
-                holding_reg=base_adr + 6,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="localisation ID",
-                input_reg=base_adr + 9,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="status",
-                input_reg=base_adr + 1,
-                value_mapping=status_mapping,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="ventilation level",
-                input_reg=base_adr + 2,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="temperature",
-                input_reg=base_adr + 3,
-                number_of_decimals=1,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="ventilation setpoint",
-                holding_reg=base_adr + 0,
-                min_value=-1,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="flow",
-                holding_reg=base_adr + 4,
-            ),
-            
-        ]
+    register_map = VALVE_REGISTERS
 
-        print(register_sensors)
 
-        if register_sensors:
-            print("registering sensors from DucoValve")
-            register_sensors(sensors)
-
-
-class DucoSwitch(DucoGenericSensor, DucoDevice):
+class DucoSwitch(DucoGenericSensor):
     name = "control switch"
 
-    def __init__(self, mb_client: AsyncioInstrument, base_adr: int) -> None:
-        self.base_adr = base_adr
-        DucoDevice.__init__(self)
-        super().__init__(mb_client, base_adr, self.register_sensors)
 
-
-class DucoSensorlessValve(DucoValve, DucoDevice):
+class DucoSensorlessValve(DucoValve):
     name = "Sensorless valve"
 
-    def __init__(self, mb_client: AsyncioInstrument, base_adr: int) -> None:
-        DucoDevice.__init__(self)
-        DucoValve.__init__(self, mb_client, base_adr, self.register_sensors)
-
 
-class DucoCO2Valve(DucoValve, DucoCO2Sensor, DucoDevice):
+class DucoCO2Valve(DucoValve, DucoCO2Sensor):
     name = "CO2 valve"
 
-    def __init__(self, mb_client: AsyncioInstrument, base_adr: int) -> None:
-        self.base_adr = base_adr
-        DucoDevice.__init__(self)
-        DucoValve.__init__(self, mb_client, base_adr, self.register_sensors)
-        DucoCO2Sensor.__init__(self, mb_client, base_adr, self.register_sensors)
+    register_map = merge_registers(VALVE_REGISTERS, CO2_REGISTERS)
 
 
-class DucoHumValve(DucoValve, DucoHumSensor, DucoDevice):
+class DucoHumValve(DucoValve, DucoHumSensor):
     name = "Humidity valve"
 
-    def __init__(self, mb_client: AsyncioInstrument, base_adr: int) -> None:
-        self.base_adr = base_adr
-        DucoDevice.__init__(self)
-        DucoValve.__init__(self, mb_client, base_adr, self.register_sensors)
-        DucoHumSensor.__init__(self, mb_client, base_adr, self.register_sensors)
+    register_map = merge_registers(VALVE_REGISTERS, HUMIDITY_REGISTERS)
 
 
-class DucoCO2HumValve(DucoValve, DucoCO2Sensor, DucoHumSensor, DucoDevice):
+class DucoCO2HumValve(DucoValve, DucoCO2Sensor, DucoHumSensor):
     name = "Humidity and CO2 valve"
 
-    def __init__(self, mb_client: AsyncioInstrument, base_adr: int) -> None:
-        self.base_adr = base_adr
-        DucoDevice.__init__(self)
-        DucoValve.__init__(self, mb_client, base_adr, self.register_sensors)
-        DucoCO2Sensor.__init__(self, mb_client, base_adr, self.register_sensors)
-        DucoHumSensor.__init__(self, mb_client, base_adr, self.register_sensors)
+    register_map = merge_registers(
+        VALVE_REGISTERS, CO2_REGISTERS, HUMIDITY_REGISTERS
+    )
 
 
-class DucoVentValve(DucoValve, DucoDevice):
+class DucoVentValve(DucoValve):
     name = "Tronic vent valve"
 
-    def __init__(self, mb_client: AsyncioInstrument, base_adr: int) -> None:
-        self.base_adr = base_adr
-        DucoDevice.__init__(self)
-        DucoValve.__init__(self, mb_client, base_adr, self.register_sensors)
-
-        sensors = [
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="grille position",
-                input_reg=base_adr + 2,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="temperature",
-                input_reg=base_adr + 3,
-                number_of_decimals=1,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="inlet",
-                holding_reg=base_adr + 4,
-            ),
-        ]
-
-        self.register_sensors(sensors)
+    register_map = merge_registers(
+        VALVE_REGISTERS,
+        (
+            sensor_register("grille position", input_reg=2),
+            sensor_register("inlet", holding_reg=4),
+        ),
+    )
 
 
 class DucoRelay(DucoDevice):
     name = "relay contact"
 
-    def __init__(self, mb_client: AsyncioInstrument, base_adr: int) -> None:
-        self.base_adr = base_adr
-        DucoDevice.__init__(self)
-
-        sensors = [
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="action",
-                holding_reg=base_adr + 9,
-                min_value=1,
-                max_value=6,
-                step_value=1,
-                value_mapping=action_mapping,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="status",
-                input_reg=base_adr + 1,
-                value_mapping=status_mapping,
-            ),
-            GenericSensor(
-                mb_client,
-                module=self,
-                name="ventilation level",
-                input_reg=base_adr + 2,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="ventilation setpoint",
-                holding_reg=base_adr + 0,
-                min_value=-1,
-                max_value=100,
-                step_value=5,
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="switch mode",
-                holding_reg=base_adr + 1,
-                min_value=0,
-                max_value=2,
-                step_value=1,
-                value_mapping={0: "overrule", 1: "heatpump", 2: "presence"},
-            ),
-            GenericActuator(
-                mb_client,
-                module=self,
-                name="switch value",
-                holding_reg=base_adr + 2,
-                min_value=0,
-                max_value=255,
-                step_value=5,
-            ),
-        ]
-
-        self.register_sensors(sensors)
+    register_map = (
+        ACTION,
+        STATUS,
+        VENTILATION_LEVEL,
+        VENTILATION_SETPOINT,
+        actuator_register(
+            "switch mode",
+            1,
+            min_value=0,
+            max_value=2,
+            step_value=1,
+            value_mapping={0: "overrule", 1: "heatpump", 2: "presence"},
+        ),
+        actuator_register(
+            "switch value", 2, min_value=0, max_value=255, step_value=5
+        ),
+    )
 
 
 ducobox_modules = {
@@ -859,8 +1933,6 @@ ducobox_modules = {
 ###########################################################
 ###########################################################
 if __name__ == "__main__":
-    import time
-
     loop = asyncio.get_event_loop()
 
     dbb = DucoBoxBase("/dev/ttyACM2", simulate=False)
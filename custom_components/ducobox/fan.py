@@ -13,6 +13,7 @@ from homeassistant.core import HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers.entity import DeviceInfo, Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.util.percentage import (
     percentage_to_ranged_value,
     ranged_value_to_percentage,
@@ -21,7 +22,7 @@ from homeassistant.util.percentage import (
 from . import DOMAIN
 from .ducobox import GenericSensor, DucoBox, GenericActuator, DucoValve, DucoRelay
 from datetime import timedelta
-from . import get_unit
+from . import get_unit, signal_new_modules, DucoCoordinatorEntity
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -47,50 +48,86 @@ async def async_setup_entry(
     # await coordinator.async_config_entry_first_refresh()
 
     # master_module = dbb.modules[0]
-    entities_list = []
-    for module in dbb.modules:
-        device_id = module.base_adr
+    @callback
+    def add_modules(modules):
+        entities_list = []
+        for module in modules:
+            device_id = module.device_id
 
-        if isinstance(module, (DucoBox, DucoValve)):
-            _LOGGER.info("Adding %s" % str(module))
-            new_entity = DucoFanEntity(module, device_id)
-            entities_list.append(new_entity)
+            if isinstance(module, (DucoBox, DucoValve)):
+                _LOGGER.info("Adding %s" % str(module))
+                new_entity = DucoFanEntity(coordinator, module, device_id)
+                entities_list.append(new_entity)
 
-    # Add all entities to HA
-    async_add_entities(entities_list, update_before_add=False)
+        # Add all entities to HA
+        async_add_entities(entities_list, update_before_add=False)
 
+    add_modules(dbb.modules)
+    # Modules found by a later rescan of the bus
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, signal_new_modules(config_entry), add_modules)
+    )
 
 
-class DucoFanEntity(FanEntity):
+
+class DucoFanEntity(DucoCoordinatorEntity, FanEntity):
     
     _attr_supported_features = FanEntityFeature.SET_SPEED 
     _attr_preset_modes = ["Auto"]
     _attr_speed_count = 100
     _attr_unique_id = True
     
-    def __init__(self, module, device_id):
+    def __init__(self, coordinator, module, device_id):
+        DucoCoordinatorEntity.__init__(self, coordinator, context=device_id)
         self.module = module
         self.device_id = device_id
         self._status = module.sensors_by_name['action']
         self._setpoint = module.sensors_by_name['ventilation setpoint']
         self._level = module.sensors_by_name["ventilation level"]
+
+    async def async_added_to_hass(self) -> None:
+        """Poll the fan registers while the entity is enabled."""
+        await super().async_added_to_hass()
+        for sens in (self._status, self._setpoint, self._level):
+            sens.subscribe()
+
+    async def async_will_remove_from_hass(self) -> None:
+        await super().async_will_remove_from_hass()
+        for sens in (self._status, self._setpoint, self._level):
+            sens.unsubscribe()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Only write the state when one of the fan registers changed."""
+        self._write_on_change(
+            self._status.alias, self._setpoint.alias, self._level.alias
+        )
         
     async def async_set_preset_mode(self, preset_mode: str) -> None:
         """Set the preset mode of the fan."""
         if preset_mode == "Auto":
-            await self._status.write("Automatic")
-            await self._setpoint.write(-1)
+            await self.module.write_settings(
+                {"action": "Automatic", "ventilation setpoint": -1}
+            )
+            self.async_write_ha_state()
     
     async def async_set_percentage(self, percentage: int) -> None:
         """Set the speed of the fan, as a percentage."""
         await self._setpoint.write(int(percentage))
+        self.async_write_ha_state()
         
     async def async_turn_off(self, **kwargs) -> None:
         """Turn the fan off."""
         await self.async_set_preset_mode("Auto")
         
+    @property
+    def available(self) -> bool:
+        return super().available and self._level.enabled
+
     @property
     def is_on(self):
+        if self._level.value is None:
+            return None
         return self._level.value > 0
         
     @property
@@ -118,7 +155,7 @@ class DucoFanEntity(FanEntity):
                     self.device_id,
                 )
             },
-            name=self.module.name + str(" @ adress ") + str(self.device_id),
+            name=self.module.name + str(" @ adress ") + str(self.module.label),
             manufacturer="DucoBox Focus",
             model=self.module.name,
         )
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""Value history of a sensor.
+
+A fixed size ring buffer of (timestamp, value) samples, backed by two arrays,
+with running statistics over the samples in the buffer. Adding a sample is
+O(1) (amortised for min/max), so the statistics can be published every poll
+cycle without touching the recorder database.
+"""
+
+from array import array
+from collections import deque
+import math
+import time
+
+# Samples kept per sensor, one hour at the default update interval
+HISTORY_SIZE = 360
+
+
+class ValueHistory:
+    """Ring buffer of the last `size` samples and their statistics"""
+
+    __slots__ = (
+        "size",
+        "timestamps",
+        "values",
+        "count",
+        "_next",
+        "_seq",
+        "_shift",
+        "_sum",
+        "_sum_sq",
+        "_min",
+        "_max",
+    )
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self.timestamps = array("d", bytes(8 * size))
+        self.values = array("d", bytes(8 * size))
+        self.count = 0
+        self._next = 0
+        self._seq = 0
+        # Sums of (value - shift), keeps the variance accurate for values
+        # with a large offset like CO2
+        self._shift = None
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        # Monotonic queues of (sequence number, value) for the window extremes
+        self._min = deque()
+        self._max = deque()
+
+    def add(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        if self._shift is None:
+            self._shift = value
+
+        if self.count == self.size:
+            old = self.values[self._next] - self._shift
+            self._sum -= old
+            self._sum_sq -= old * old
+        else:
+            self.count += 1
+
+        self.timestamps[self._next] = timestamp
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.size
+
+        if self._next == 0 and self.count == self.size:
+            # Recompute the sums once per lap, rounding errors do not pile up
+            deltas = [v - self._shift for v in self.values]
+            self._sum = math.fsum(deltas)
+            self._sum_sq = math.fsum(d * d for d in deltas)
+        else:
+            delta = value - self._shift
+            self._sum += delta
+            self._sum_sq += delta * delta
+
+        # Drop the extremes which left the window or can never be one again
+        oldest = self._seq - self.count + 1
+        for queue in (self._min, self._max):
+            while queue and queue[0][0] < oldest:
+                queue.popleft()
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._min.append((self._seq, value))
+        self._max.append((self._seq, value))
+        self._seq += 1
+
+    def clear(self):
+        self.count = 0
+        self._next = 0
+        self._shift = None
+        self._sum = self._sum_sq = 0.0
+        self._min.clear()
+        self._max.clear()
+
+    @property
+    def min(self):
+        return self._min[0][1] if self.count else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self.count else None
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self._shift + self._sum / self.count
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return None
+        mean = self._sum / self.count
+        return math.sqrt(max(self._sum_sq / self.count - mean * mean, 0.0))
+
+    @property
+    def since(self):
+        """Timestamp of the oldest sample"""
+        if not self.count:
+            return None
+        return self.timestamps[(self._next - self.count) % self.size]
+
+    def samples(self):
+        """All samples, oldest first: [(timestamp, value)]"""
+        start = self._next - self.count
+        return [
+            (self.timestamps[idx % self.size], self.values[idx % self.size])
+            for idx in range(start, self._next)
+        ]
+
+    def statistics(self, number_of_decimals=None):
+        """Statistics of the window, rounded to the precision of the sensor"""
+        stats = {
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "stddev": self.stddev,
+        }
+        if number_of_decimals is not None and self.count:
+            stats = {
+                key: round(value, number_of_decimals + 1)
+                for key, value in stats.items()
+            }
+        stats["samples"] = self.count
+        return stats
@@ -0,0 +1,146 @@
+"""Instrumentation of the Modbus bus and the poll cycle.
+
+The transaction queue counts the frames, timeouts, corrupt responses and
+retries and measures the queue wait and write latency, the poll cycle adds
+its duration. Totals are kept since the start, the counters of the last
+poll cycle are kept separately.
+"""
+
+import time
+
+# Upper bounds of the latency histogram buckets (seconds)
+LATENCY_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+
+COUNTERS = ("frames", "timeouts", "crc_errors", "exceptions", "retries")
+
+
+class Histogram:
+    """Latency histogram with fixed buckets"""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The last bucket holds everything above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        idx = 0
+        while idx < len(self.buckets) and value > self.buckets[idx]:
+            idx += 1
+        self.counts[idx] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the percentile"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def as_dict(self):
+        buckets = {"le_%g" % bound: n for bound, n in zip(self.buckets, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p95": self.percentile(0.95),
+            "max": self.max,
+            "buckets": buckets,
+        }
+
+
+class BusMetrics:
+    """Counters and histograms of one bus (transaction queue)"""
+
+    def __init__(self):
+        self.totals = dict.fromkeys(COUNTERS, 0)
+        self.cycle = dict.fromkeys(COUNTERS, 0)
+        self.cycles = 0
+        self.cycle_duration = None
+        self.cycle_queue_wait = None
+        self.cycle_durations = Histogram()
+        self.queue_wait = Histogram()
+        self.write_latency = Histogram()
+        self._cycle_start = None
+        self._cycle_totals = None
+        self._cycle_wait = (0, 0.0)
+        self._published = {}
+
+    def count(self, counter, increment=1):
+        self.totals[counter] += increment
+
+    def start_cycle(self):
+        self._cycle_start = time.monotonic()
+        self._cycle_totals = dict(self.totals)
+        self._cycle_wait = (self.queue_wait.count, self.queue_wait.sum)
+
+    def end_cycle(self):
+        if self._cycle_start is None:
+            return
+        self.cycles += 1
+        self.cycle_duration = time.monotonic() - self._cycle_start
+        self.cycle_durations.add(self.cycle_duration)
+        self.cycle = {
+            counter: self.totals[counter] - self._cycle_totals[counter]
+            for counter in COUNTERS
+        }
+        count, total = self._cycle_wait
+        count = self.queue_wait.count - count
+        self.cycle_queue_wait = (self.queue_wait.sum - total) / count if count else 0
+        self._cycle_start = None
+
+    def state(self):
+        """Values of the diagnostic entities: {key: value}"""
+        write_latency = self.write_latency.mean
+        return {
+            "cycle duration": (
+                None if self.cycle_duration is None else round(self.cycle_duration, 3)
+            ),
+            "cycle frames": self.cycle["frames"],
+            "queue wait": (
+                None
+                if self.cycle_queue_wait is None
+                else round(1000 * self.cycle_queue_wait, 1)
+            ),
+            "write latency": (
+                None if write_latency is None else round(1000 * write_latency, 1)
+            ),
+            "frames": self.totals["frames"],
+            "timeouts": self.totals["timeouts"],
+            "crc errors": self.totals["crc_errors"],
+            "retries": self.totals["retries"],
+        }
+
+    def changes(self, prefix=""):
+        """Entity values changed since the previous call: {prefix + key: value}"""
+        changes = {}
+        for key, value in self.state().items():
+            if self._published.get(key) != value:
+                self._published[key] = value
+                changes[prefix + key] = value
+        return changes
+
+    def as_dict(self):
+        return {
+            "cycles": self.cycles,
+            "totals": dict(self.totals),
+            "last_cycle": dict(self.cycle, duration=self.cycle_duration),
+            "cycle_duration": self.cycle_durations.as_dict(),
+            "queue_wait": self.queue_wait.as_dict(),
+            "write_latency": self.write_latency.as_dict(),
+        }
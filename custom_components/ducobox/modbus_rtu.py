@@ -0,0 +1,336 @@
+"""Asyncio Modbus RTU client.
+
+Implements the function codes used by the DucoBox (3, 4, 6 and 16) directly
+on top of an asyncio serial connection, framing, CRC and timeouts are handled
+by the event loop instead of a blocking serial port in an executor thread.
+"""
+
+import asyncio
+import logging
+import struct
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ModbusException(IOError):
+    """Base class for all Modbus errors"""
+
+
+class SlaveReportedException(ModbusException):
+    """The slave answered with a Modbus exception response"""
+
+
+class NoResponseError(ModbusException):
+    """No (complete) response within the timeout"""
+
+
+class InvalidResponseError(ModbusException):
+    """The response is corrupt (CRC, length, adress or function code)"""
+
+
+def crc16(data: bytes) -> int:
+    """Modbus CRC-16 of a frame"""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc
+
+
+def add_crc(frame: bytes) -> bytes:
+    return frame + struct.pack("<H", crc16(frame))
+
+
+def check_crc(frame: bytes) -> bool:
+    return len(frame) >= 4 and crc16(frame[:-2]) == struct.unpack("<H", frame[-2:])[0]
+
+
+def encode_value(value, number_of_decimals=0, signed=False):
+    """Scale a value to a 16 bit register"""
+    raw = int(round(value * 10**number_of_decimals))
+    if signed and raw < 0:
+        raw += 0x10000
+    if not 0 <= raw <= 0xFFFF:
+        raise ValueError("Value %s does not fit in a register" % str(value))
+    return raw
+
+
+def decode_value(raw, number_of_decimals=0, signed=False):
+    """Convert a 16 bit register to its (scaled) value"""
+    if signed and raw >= 0x8000:
+        raw -= 0x10000
+    if number_of_decimals:
+        return raw / 10**number_of_decimals
+    return raw
+
+
+def build_request(slave_adr, functioncode, registeraddress, values=None, count=1):
+    """Create the PDU (without CRC) of a request and the expected response length"""
+    if functioncode in (3, 4):
+        pdu = struct.pack(">BBHH", slave_adr, functioncode, registeraddress, count)
+        # adress, function code, byte count, data, CRC
+        return pdu, 5 + 2 * count
+    if functioncode == 6:
+        pdu = struct.pack(">BBHH", slave_adr, functioncode, registeraddress, values[0])
+        return pdu, 8
+    if functioncode == 16:
+        pdu = struct.pack(
+            ">BBHHB",
+            slave_adr,
+            functioncode,
+            registeraddress,
+            len(values),
+            2 * len(values),
+        ) + struct.pack(">%dH" % len(values), *values)
+        return pdu, 8
+
+    raise ValueError("Unsupported function code %d" % functioncode)
+
+
+def parse_response(request, response):
+    """Validate a response (without CRC) and return the register values"""
+    slave_adr, functioncode = request[0], request[1]
+    if response[0] != slave_adr:
+        raise InvalidResponseError("Response from wrong slave %d" % response[0])
+    if response[1] == functioncode | 0x80:
+        raise SlaveReportedException("Slave reported exception code %d" % response[2])
+    if response[1] != functioncode:
+        raise InvalidResponseError("Wrong function code %d" % response[1])
+
+    if functioncode in (3, 4):
+        count = response[2] // 2
+        return list(struct.unpack(">%dH" % count, response[3 : 3 + 2 * count]))
+
+    if response[2:6] != request[2:6]:
+        raise InvalidResponseError("Write not confirmed")
+    return None
+
+
+class ModbusFrameProtocol(asyncio.Protocol):
+    """Collects the received bytes of a stream based transport"""
+
+    def __init__(self):
+        self.transport = None
+        self.buffer = bytearray()
+        self._data_received = asyncio.Event()
+        self.connection_lost_exc = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        self._data_received.set()
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.connection_lost_exc = exc if exc else ConnectionError("Connection closed")
+        self._data_received.set()
+
+    def flush(self):
+        if self.buffer:
+            _LOGGER.debug("Dropping %d stale bytes" % len(self.buffer))
+        self.buffer.clear()
+
+    async def wait_for(self, length, deadline):
+        """Wait until length bytes are buffered or the deadline (loop time) passed"""
+        loop = asyncio.get_running_loop()
+        while len(self.buffer) < length:
+            if self.connection_lost_exc is not None:
+                raise NoResponseError(str(self.connection_lost_exc))
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            self._data_received.clear()
+            try:
+                await asyncio.wait_for(self._data_received.wait(), remaining)
+            except asyncio.TimeoutError:
+                return len(self.buffer) >= length
+        return True
+
+
+class ModbusRtuClient:
+    """Modbus RTU master on an asyncio serial connection.
+
+    Provides the register methods of minimalmodbus' Instrument (register
+    adresses are zero based) so it can be used by GenericSensor unchanged.
+    The methods address slave_adr unless another slave adress is given, so
+    one client serves all slaves on the bus.
+    """
+
+    # Transactions which may be in flight at the same time
+    max_outstanding = 1
+
+    def __init__(self, port, slave_adr, baudrate=9600, timeout=0.1):
+        self.port = port
+        self.slave_adr = slave_adr
+        self.baudrate = baudrate
+        self.timeout = timeout
+        # 11 bits per character: start, 8 data, parity and stop bit
+        self.char_time = 11 / baudrate
+        self.frame_gap = 3.5 * self.char_time if baudrate <= 19200 else 0.00175
+        self._protocol = None
+        self._last_frame = 0
+
+    @property
+    def connected(self):
+        return self._protocol is not None and self._protocol.transport is not None
+
+    async def _open(self, protocol_factory):
+        loop = asyncio.get_running_loop()
+        try:
+            from serial_asyncio_fast import create_serial_connection
+        except ImportError:
+            from serial_asyncio import create_serial_connection
+
+        _, protocol = await create_serial_connection(
+            loop, protocol_factory, self.port, baudrate=self.baudrate
+        )
+        return protocol
+
+    async def connect(self):
+        self._protocol = await self._open(ModbusFrameProtocol)
+
+    async def close(self):
+        if self.connected:
+            self._protocol.transport.close()
+        self._protocol = None
+
+    async def _reconnect(self):
+        """Open the connection, a failure counts as a missing response
+
+        E.g. a serial port which is unplugged raises a SerialException, it
+        has to pass the retries and the circuit breaker like a timeout.
+        """
+        try:
+            await self.connect()
+        except ModbusException:
+            raise
+        except OSError as exc:
+            raise NoResponseError("Connection failed: %s" % exc) from exc
+
+    def _send(self, protocol, frame, slave_adr):
+        """Write a frame, a failure counts as a missing response"""
+        if protocol.transport is None:
+            raise NoResponseError("Connection to slave %d lost" % slave_adr)
+        try:
+            protocol.transport.write(frame)
+        except OSError as exc:
+            raise NoResponseError(
+                "Failed to send to slave %d: %s" % (slave_adr, exc)
+            ) from exc
+
+    def _frame(self, pdu):
+        return add_crc(pdu)
+
+    def _unframe(self, frame):
+        if not check_crc(frame):
+            raise InvalidResponseError("CRC error")
+        return frame[:-2]
+
+    def _response_length(self, buffer, expected):
+        """Length of the response frame, based on the bytes received so far"""
+        if len(buffer) >= 2 and buffer[1] & 0x80:
+            return 5
+        return expected
+
+    async def _transaction(self, pdu, response_length, timeout=None):
+        """Send a request and wait for its response
+
+        The timeout applies to this transaction only, the client timeout is
+        used when it is None.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        if not self.connected:
+            await self._reconnect()
+
+        loop = asyncio.get_running_loop()
+        protocol = self._protocol
+
+        # Respect the inter-frame silence after the previous frame
+        silence = self._last_frame + self.frame_gap - loop.time()
+        if silence > 0:
+            await asyncio.sleep(silence)
+
+        protocol.flush()
+        frame = self._frame(pdu)
+        self._send(protocol, frame, pdu[0])
+
+        # The request still needs to be transmitted before the timeout starts
+        deadline = loop.time() + len(frame) * self.char_time + timeout
+        try:
+            if not await protocol.wait_for(2, deadline):
+                raise NoResponseError("No response from slave %d" % pdu[0])
+
+            length = self._response_length(protocol.buffer, response_length)
+            if not await protocol.wait_for(length, deadline):
+                raise NoResponseError(
+                    "Incomplete response from slave %d" % pdu[0]
+                )
+            response = bytes(protocol.buffer[:length])
+        finally:
+            self._last_frame = loop.time()
+
+        return parse_response(pdu, self._unframe(response))
+
+    def _slave(self, slave_adr):
+        return self.slave_adr if slave_adr is None else slave_adr
+
+    async def read_registers(
+        self,
+        registeraddress,
+        number_of_registers,
+        functioncode=3,
+        slave_adr=None,
+        timeout=None,
+    ):
+        pdu, response_length = build_request(
+            self._slave(slave_adr),
+            functioncode,
+            registeraddress,
+            count=number_of_registers,
+        )
+        return await self._transaction(pdu, response_length, timeout)
+
+    async def read_register(
+        self,
+        registeraddress,
+        number_of_decimals=0,
+        functioncode=3,
+        signed=False,
+        slave_adr=None,
+        timeout=None,
+    ):
+        values = await self.read_registers(
+            registeraddress, 1, functioncode, slave_adr=slave_adr, timeout=timeout
+        )
+        return decode_value(values[0], number_of_decimals, signed)
+
+    async def write_registers(
+        self, registeraddress, values, slave_adr=None, timeout=None
+    ):
+        pdu, response_length = build_request(
+            self._slave(slave_adr), 16, registeraddress, values=list(values)
+        )
+        await self._transaction(pdu, response_length, timeout)
+
+    async def write_register(
+        self,
+        registeraddress,
+        value,
+        number_of_decimals=0,
+        functioncode=16,
+        signed=False,
+        slave_adr=None,
+        timeout=None,
+    ):
+        raw = encode_value(value, number_of_decimals, signed)
+        pdu, response_length = build_request(
+            self._slave(slave_adr), functioncode, registeraddress, values=[raw]
+        )
+        await self._transaction(pdu, response_length, timeout)
@@ -0,0 +1,143 @@
+"""Asyncio Modbus clients for networked RS485 gateways.
+
+Two flavours are supported: plain RTU frames tunnelled over a TCP socket
+(RTU-over-TCP) and Modbus TCP, where the gateway converts MBAP frames to RTU.
+Both keep one persistent connection, which is reopened on the next
+transaction when it drops.
+"""
+
+import asyncio
+import itertools
+import logging
+import struct
+
+try:
+    from .modbus_rtu import (
+        InvalidResponseError,
+        ModbusRtuClient,
+        NoResponseError,
+        parse_response,
+    )
+except ImportError:
+    from modbus_rtu import (
+        InvalidResponseError,
+        ModbusRtuClient,
+        NoResponseError,
+        parse_response,
+    )
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TCP_PORT = 502
+
+
+class ModbusRtuOverTcpClient(ModbusRtuClient):
+    """RTU frames (including CRC) over a TCP connection.
+
+    The baudrate is the one of the RS485 side of the gateway, it is only used
+    to account for the transmission time in the timeouts.
+    """
+
+    def __init__(self, host, port, slave_adr, baudrate=9600, timeout=0.1):
+        super().__init__(
+            "%s:%d" % (host, port), slave_adr, baudrate=baudrate, timeout=timeout
+        )
+        self.host = host
+        self.tcp_port = port
+
+    async def _open(self, protocol_factory):
+        loop = asyncio.get_running_loop()
+        _, protocol = await loop.create_connection(
+            protocol_factory, self.host, self.tcp_port
+        )
+        return protocol
+
+
+class ModbusTcpProtocol(asyncio.Protocol):
+    """Splits the received stream in MBAP frames and matches them to requests"""
+
+    def __init__(self):
+        self.transport = None
+        self.buffer = bytearray()
+        self.pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        # MBAP header: transaction id, protocol id, length (unit id + PDU)
+        while len(self.buffer) >= 6:
+            transaction_id, _, length = struct.unpack(">HHH", self.buffer[:6])
+            if len(self.buffer) < 6 + length:
+                break
+            frame = bytes(self.buffer[6 : 6 + length])
+            del self.buffer[: 6 + length]
+
+            future = self.pending.pop(transaction_id, None)
+            if future is None:
+                _LOGGER.debug("Dropping late response %d" % transaction_id)
+            elif not future.done():
+                future.set_result(frame)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(NoResponseError("Connection closed"))
+        self.pending.clear()
+
+
+class ModbusTcpClient(ModbusRtuOverTcpClient):
+    """Modbus TCP master.
+
+    Requests are tagged with a transaction id, so several requests can be
+    pipelined on the connection; the gateway answers them in order.
+    """
+
+    max_outstanding = 4
+
+    def __init__(self, host, port, slave_adr, baudrate=9600, timeout=0.1):
+        super().__init__(host, port, slave_adr, baudrate=baudrate, timeout=timeout)
+        self._transaction_ids = itertools.count()
+        self._connecting = asyncio.Lock()
+
+    async def connect(self):
+        self._protocol = await self._open(ModbusTcpProtocol)
+
+    async def _transaction(self, pdu, response_length, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        async with self._connecting:
+            if not self.connected:
+                await self._reconnect()
+
+        loop = asyncio.get_running_loop()
+        protocol = self._protocol
+        transaction_id = next(self._transaction_ids) & 0xFFFF
+        future = loop.create_future()
+        protocol.pending[transaction_id] = future
+
+        try:
+            self._send(
+                protocol,
+                struct.pack(">HHH", transaction_id, 0, len(pdu)) + pdu,
+                pdu[0],
+            )
+        except NoResponseError:
+            protocol.pending.pop(transaction_id, None)
+            raise
+
+        # The requests in front of this one still need to be transmitted by
+        # the gateway
+        timeout = timeout * len(protocol.pending) + response_length * self.char_time
+        try:
+            response = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError as exc:
+            raise NoResponseError("No response from slave %d" % pdu[0]) from exc
+        finally:
+            protocol.pending.pop(transaction_id, None)
+
+        if len(response) < 3:
+            raise InvalidResponseError("Response too short")
+        return parse_response(pdu, response)
@@ -2,12 +2,12 @@ from __future__ import annotations
 import logging
 
 from homeassistant.components.sensor.const import SensorDeviceClass
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity import EntityCategory
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.helpers.update_coordinator import  CoordinatorEntity
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.components.number import (
     NumberDeviceClass,
     NumberEntity,
@@ -15,7 +15,13 @@ from homeassistant.components.number import (
 
 from . import DOMAIN
 from .ducobox import GenericActuator
-from . import get_unit, DucoSensorCoordinator
+from . import (
+    get_unit,
+    signal_new_modules,
+    signal_new_sensors,
+    DucoSensorCoordinator,
+    DucoCoordinatorEntity,
+)
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -30,19 +36,34 @@ async def async_setup_entry(
     
     dbb, coordinator = hass.data[DOMAIN][config_entry.entry_id]
 
-    for module in dbb.modules:
-        device_id = module.base_adr
-        sensors = []
-        for sens in module.sensors:
-            if isinstance(sens, GenericActuator):
-                new_entity = DucoNumberController(coordinator, sens, device_id)
-                sensors.append(new_entity)
+    @callback
+    def add_sensors(sensors):
+        async_add_entities(
+            [
+                DucoNumberController(coordinator, sens, sens.module.device_id)
+                for sens in sensors
+                if isinstance(sens, GenericActuator)
+            ],
+            update_before_add=True,
+        )
+
+    @callback
+    def add_modules(modules):
+        for module in modules:
+            add_sensors(module.sensors)
 
-        # Add all entities to HA
-        async_add_entities(sensors, update_before_add=True)
+    add_modules(dbb.modules)
+    # Modules found by a later rescan of the bus
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, signal_new_modules(config_entry), add_modules)
+    )
+    # Sensors found on known modules
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, signal_new_sensors(config_entry), add_sensors)
+    )
 
 
-class DucoNumberController(CoordinatorEntity, NumberEntity):
+class DucoNumberController(DucoCoordinatorEntity, NumberEntity):
     """Use to control valve flow, setpoints of CO2/Humidity"""
 
     # _attr_unique_id = True
@@ -54,11 +75,30 @@ class DucoNumberController(CoordinatorEntity, NumberEntity):
         device_id,
     ) -> None:
         """Initialize the sensor."""
-        CoordinatorEntity.__init__(self, coordinator, context=device_id)
+        DucoCoordinatorEntity.__init__(self, coordinator, context=sens.alias)
         NumberEntity.__init__(self)
         self.sens_obj = sens
         self.device_id = device_id
 
+    async def async_added_to_hass(self) -> None:
+        """Poll the register while the entity is enabled."""
+        await super().async_added_to_hass()
+        self.sens_obj.subscribe()
+
+    async def async_will_remove_from_hass(self) -> None:
+        await super().async_will_remove_from_hass()
+        self.sens_obj.unsubscribe()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Only write the state when the value of this setting changed."""
+        self._write_on_change(self.sens_obj.alias)
+
+    @property
+    def available(self) -> bool:
+        """Quarantined sensors are unavailable until a re-probe succeeds."""
+        return super().available and self.sens_obj.enabled
+
     @property
     def entity_category(self):
         return EntityCategory.CONFIG
@@ -97,6 +137,7 @@ class DucoNumberController(CoordinatorEntity, NumberEntity):
         """Update the current value."""
         _LOGGER.info("%s Writing %f " % (self.sens_obj.alias, value))
         await self.sens_obj.write(value)
+        self.async_write_ha_state()
 
     @property
     def device_class(self) -> str | None:
@@ -118,7 +159,9 @@ class DucoNumberController(CoordinatorEntity, NumberEntity):
                     self.device_id,
                 )
             },
-            name=self.sens_obj.module.name + str(" @ adress ") + str(self.device_id),
+            name=self.sens_obj.module.name
+            + str(" @ adress ")
+            + str(self.sens_obj.module.label),
             manufacturer="DucoBox Focus",
             model=self.sens_obj.module.name,
         )
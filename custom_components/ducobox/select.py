@@ -60,7 +60,7 @@ async def async_setup_entry(
 
     # master_module = dbb.modules[0]
     for module in dbb.modules:
-        device_id = module.base_adr
+        device_id = module.device_id
         sensors = []
         for sens in module.sensors:
             if isinstance(sens, GenericActuator) and sens.name == "action":
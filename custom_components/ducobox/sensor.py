@@ -3,16 +3,23 @@ from __future__ import annotations
 import logging
 
 from homeassistant.components.sensor import SensorEntity
-from homeassistant.components.sensor.const import SensorDeviceClass
-from homeassistant.core import HomeAssistant
+from homeassistant.components.sensor.const import SensorDeviceClass, SensorStateClass
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.helpers.update_coordinator import  CoordinatorEntity
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 
 from . import DOMAIN
-from .ducobox import GenericSensor, GenericActuator
-from . import get_unit, DucoSensorCoordinator
+from .ducobox import GenericSensor, GenericActuator, DucoBoxBase, METRICS_PREFIX
+from . import (
+    get_unit,
+    signal_new_modules,
+    signal_new_sensors,
+    DucoSensorCoordinator,
+    DucoCoordinatorEntity,
+)
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -26,22 +33,58 @@ async def async_setup_entry(
 
     dbb, coordinator = hass.data[DOMAIN][config_entry.entry_id]
 
-    for module in dbb.modules:
-        device_id = module.base_adr
-        sensors = []
-        for sens in module.sensors:
-            if isinstance(sens, GenericSensor):
-                new_entity = DocuSensor(coordinator, sens, device_id)
-                sensors.append(new_entity)
-
-        # Add all sensor entities to HA
-        async_add_entities(sensors, update_before_add=True)
-
+    @callback
+    def add_sensors(sensors):
+        async_add_entities(
+            [
+                DocuSensor(coordinator, sens, sens.module.device_id)
+                for sens in sensors
+                if isinstance(sens, GenericSensor)
+            ],
+            update_before_add=True,
+        )
 
-class DocuSensor(CoordinatorEntity, SensorEntity):
+    @callback
+    def add_modules(modules):
+        for module in modules:
+            add_sensors(module.sensors)
+
+    add_modules(dbb.modules)
+    # Modules found by a later rescan of the bus
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, signal_new_modules(config_entry), add_modules)
+    )
+    # Sensors found on known modules
+    config_entry.async_on_unload(
+        async_dispatcher_connect(hass, signal_new_sensors(config_entry), add_sensors)
+    )
+
+    async_add_entities(
+        DucoBusSensor(coordinator, dbb, key, unit, state_class)
+        for key, (unit, state_class) in bus_sensors.items()
+    )
+
+
+# Bus metrics: key -> (unit, state class)
+bus_sensors = {
+    "cycle duration": (UnitOfTime.SECONDS, SensorStateClass.MEASUREMENT),
+    "cycle frames": (None, SensorStateClass.MEASUREMENT),
+    "queue wait": (UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "write latency": (UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT),
+    "frames": (None, SensorStateClass.TOTAL_INCREASING),
+    "timeouts": (None, SensorStateClass.TOTAL_INCREASING),
+    "crc errors": (None, SensorStateClass.TOTAL_INCREASING),
+    "retries": (None, SensorStateClass.TOTAL_INCREASING),
+}
+
+
+class DocuSensor(DucoCoordinatorEntity, SensorEntity):
     """Representation of a sensor."""
 
     _attr_unique_id = True
+    # The rolling statistics change with every reading, keep them out of the
+    # database
+    _unrecorded_attributes = frozenset({"min", "max", "mean", "stddev", "samples"})
 
     def __init__(
         self,
@@ -50,12 +93,26 @@ class DocuSensor(CoordinatorEntity, SensorEntity):
         device_id,
     ) -> None:
         """Initialize the sensor."""
-        super().__init__(coordinator, context=device_id)
+        super().__init__(coordinator, context=sens.alias)
         self.sens_obj = sens
         self.device_id = device_id
 
         self.unit = get_unit(self.name)
 
+    async def async_added_to_hass(self) -> None:
+        """Poll the register while the entity is enabled."""
+        await super().async_added_to_hass()
+        self.sens_obj.subscribe()
+
+    async def async_will_remove_from_hass(self) -> None:
+        await super().async_will_remove_from_hass()
+        self.sens_obj.unsubscribe()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Only write the state when the value of this sensor changed."""
+        self._write_on_change(self.sens_obj.alias)
+
     @property
     def name(self) -> str:
         """Return the name of the sensor."""
@@ -68,8 +125,20 @@ class DocuSensor(CoordinatorEntity, SensorEntity):
 
     @property
     def state(self):
-        """Return the state of the sensor."""
-        return self.sens_obj.value
+        """Return the state of the sensor, as it passed the publish filter."""
+        return self.coordinator.dbb.published_value(self.sens_obj)
+
+    @property
+    def extra_state_attributes(self) -> dict | None:
+        """Rolling statistics of the last readings."""
+        if self.sens_obj.history is None:
+            return None
+        return self.sens_obj.history.statistics(self.sens_obj.number_of_decimals)
+
+    @property
+    def available(self) -> bool:
+        """Quarantined sensors are unavailable until a re-probe succeeds."""
+        return super().available and self.sens_obj.enabled
 
     @property
     def entity_registry_visible_default(self):
@@ -102,9 +171,49 @@ class DocuSensor(CoordinatorEntity, SensorEntity):
                     self.device_id,
                 )
             },
-            name=self.sens_obj.module.name + str(" @ adress ") + str(self.device_id),
+            name=self.sens_obj.module.name
+            + str(" @ adress ")
+            + str(self.sens_obj.module.label),
             manufacturer="DucoBox Focus",
             model=self.sens_obj.module.name,
         )
 
 
+class DucoBusSensor(DucoCoordinatorEntity, SensorEntity):
+    """Diagnostic sensor with a metric of the Modbus bus."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(
+        self,
+        coordinator: DucoSensorCoordinator,
+        dbb: DucoBoxBase,
+        key: str,
+        unit: str | None,
+        state_class: str,
+    ) -> None:
+        super().__init__(coordinator, context=METRICS_PREFIX + key)
+        self.dbb = dbb
+        self.key = key
+        self._attr_name = "bus " + key
+        self._attr_unique_id = "%s bus %s" % (dbb.namespace, key)
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Only write the state when the metric changed."""
+        self._write_on_change(METRICS_PREFIX + self.key)
+
+    @property
+    def native_value(self):
+        return self.dbb.transactions.metrics.state()[self.key]
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return DeviceInfo(
+            identifiers={(DOMAIN, "%s bus" % self.dbb.namespace)},
+            name="DucoBox bus " + self.dbb.transactions.name,
+            manufacturer="DucoBox Focus",
+            model="Modbus RTU",
+        )
@@ -0,0 +1,320 @@
+"""Simulated DucoBox Modbus RTU bus.
+
+Every simulated box holds the register map of its modules, derived from the
+sensor definitions in ducobox.py: the type code, the input registers and the
+holding registers, which keep the values written to them. Requests are real
+RTU frames (CRC included) and are answered after the time the frames need on
+the wire at the configured baudrate, so timeouts, retries and block reads
+behave like on a real bus. Errors (lost or corrupted responses) can be
+injected at a given rate.
+
+The bus is reachable in-process through SimulatedRtuClient or over TCP with
+serve_tcp (raw RTU frames or Modbus TCP), as a stand-in for a gateway.
+"""
+
+import asyncio
+import logging
+import random
+import struct
+
+try:
+    from .ducobox import ducobox_modules, GenericActuator
+    from .modbus_rtu import ModbusRtuClient, add_crc, check_crc, encode_value
+except ImportError:
+    from ducobox import ducobox_modules, GenericActuator
+    from modbus_rtu import ModbusRtuClient, add_crc, check_crc, encode_value
+
+_LOGGER = logging.getLogger(__name__)
+
+FRAMING_RTU = "rtu"
+FRAMING_TCP = "tcp"
+
+# Modbus exception codes
+ILLEGAL_FUNCTION = 1
+ILLEGAL_ADDRESS = 2
+
+# Power-up values, in engineering units
+initial_values = {
+    "action": 5,
+    "ventilation setpoint": -1,
+    "ventilation level": 30,
+    "auto min": 10,
+    "auto max": 100,
+    "power": 12,
+    "average power": 10,
+    "maximal power": 40,
+    "temperature": 21.5,
+    "CO2 value": 650,
+    "CO2 setpoint": 1000,
+    "humidity": 55.0,
+    "humidity setpoint": 70,
+    "humidity delta": 5,
+    "flow": 50,
+    "inlet": 50,
+    "grille position": 50,
+    "button 1": 25,
+    "button 2": 50,
+    "button 3": 100,
+    "Manual Time": 15,
+}
+
+# Measurements which drift between reads: (minimum, maximum, maximal step)
+drifting_values = {
+    "CO2 value": (400, 2000, 15),
+    "humidity": (30, 90, 0.5),
+    "temperature": (15, 30, 0.1),
+    "ventilation level": (0, 100, 2),
+}
+
+
+class DucoSimulator:
+    """Register map of one DucoBox (Modbus slave) and its modules"""
+
+    def __init__(self, slave_adr=1, modules=None, seed=None, strict_spans=False):
+        """
+        modules: {base adress: type code}, defaults to one module of every type
+        strict_spans: refuse block reads which include unsupported registers
+        """
+        if modules is None:
+            modules = {
+                10 * (idx + 1): type_code
+                for idx, type_code in enumerate(ducobox_modules)
+            }
+
+        self.slave_adr = slave_adr
+        self.modules = modules
+        self.strict_spans = strict_spans
+        # Base adresses of the modules which do not answer (e.g. without power)
+        self.silent = set()
+        self.random = random.Random(seed)
+        self.input = {}
+        self.holding = {}
+        # register adress -> (number of decimals, drift)
+        self._drift = {}
+
+        for base_adr, type_code in modules.items():
+            self.add_module(base_adr, type_code)
+
+    def add_module(self, base_adr, type_code):
+        """Create the registers of a module, adresses are zero based"""
+        self.modules[base_adr] = type_code
+        self.input[base_adr - 1] = type_code
+
+        module = ducobox_modules[type_code][0](None, base_adr)
+        for sens in module.sensors:
+            if sens.name == "localisation ID":
+                value = base_adr
+            else:
+                value = initial_values.get(sens.name, 0)
+            if isinstance(sens, GenericActuator):
+                value = min(max(value, sens.min_value), sens.max_value)
+
+            adr = sens.register - 1
+            table = self.holding if sens.holding_reg else self.input
+            table[adr] = encode_value(value, sens.number_of_decimals, signed=True)
+            if sens.name in drifting_values and table is self.input:
+                self._drift[adr] = (sens.number_of_decimals, drifting_values[sens.name])
+
+    def remove_module(self, base_adr):
+        """Disconnect a module, its registers are no longer answered"""
+        self.modules.pop(base_adr, None)
+        for table in (self.input, self.holding):
+            for adr in range(base_adr - 1, base_adr + 9):
+                table.pop(adr, None)
+
+    def _read(self, table, adr):
+        raw = table[adr]
+        if table is self.input and adr in self._drift:
+            decimals, (minimum, maximum, step) = self._drift[adr]
+            value = raw / 10**decimals if decimals else raw
+            value += self.random.uniform(-step, step)
+            value = min(max(value, minimum), maximum)
+            raw = encode_value(round(value, decimals), decimals, signed=True)
+            table[adr] = raw
+        return raw
+
+    def process(self, request):
+        """Answer a request (frame without CRC), returns the response
+
+        Returns None when the adressed module is silent.
+        """
+        functioncode = request[1]
+        adr = struct.unpack(">H", request[2:4])[0]
+        if (adr + 1) // 10 * 10 in self.silent:
+            return None
+
+        if functioncode in (3, 4):
+            count = struct.unpack(">H", request[4:6])[0]
+            table = self.holding if functioncode == 3 else self.input
+            span = range(adr, adr + count)
+            supported = [reg in table for reg in span]
+            if not any(supported) or (self.strict_spans and not all(supported)):
+                return self.exception(functioncode, ILLEGAL_ADDRESS)
+
+            values = [self._read(table, reg) if reg in table else 0 for reg in span]
+            return bytes([self.slave_adr, functioncode, 2 * count]) + struct.pack(
+                ">%dH" % count, *values
+            )
+
+        if functioncode == 6:
+            values = [struct.unpack(">H", request[4:6])[0]]
+        elif functioncode == 16:
+            count = struct.unpack(">H", request[4:6])[0]
+            values = struct.unpack(">%dH" % count, request[7 : 7 + 2 * count])
+        else:
+            return self.exception(functioncode, ILLEGAL_FUNCTION)
+
+        if any(reg not in self.holding for reg in range(adr, adr + len(values))):
+            return self.exception(functioncode, ILLEGAL_ADDRESS)
+        for offset, value in enumerate(values):
+            self.holding[adr + offset] = value
+        return bytes(request[:6])
+
+    def exception(self, functioncode, code):
+        return bytes([self.slave_adr, functioncode | 0x80, code])
+
+
+class SimulatedBus:
+    """RS485 bus with one or more simulated boxes"""
+
+    def __init__(self, baudrate=9600, latency=0.005, error_rate=0.0, seed=None):
+        """
+        latency: processing time of the slave per request (seconds)
+        error_rate: fraction of the responses which get lost or corrupted
+        """
+        self.baudrate = baudrate
+        self.char_time = 11 / baudrate
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.devices = {}
+        self.frames = 0
+        self.lost = 0
+        self.corrupted = 0
+
+    def add_device(self, slave_adr=1, **kwargs) -> DucoSimulator:
+        if slave_adr not in self.devices:
+            self.devices[slave_adr] = DucoSimulator(slave_adr, **kwargs)
+        return self.devices[slave_adr]
+
+    def handle_frame(self, frame):
+        """Process an RTU frame, returns (response frame or None, delay)"""
+        self.frames += 1
+        request_time = len(frame) * self.char_time
+        device = self.devices.get(frame[0])
+        if device is None or not check_crc(frame):
+            # Nobody answers
+            return None, request_time
+
+        response = device.process(frame[:-2])
+        if response is None:
+            return None, request_time
+
+        response = bytearray(add_crc(response))
+        delay = request_time + self.latency + len(response) * self.char_time
+
+        if self.random.random() < self.error_rate:
+            if self.random.random() < 0.5:
+                self.lost += 1
+                return None, delay
+            self.corrupted += 1
+            response[self.random.randrange(len(response))] ^= 0xFF
+
+        return bytes(response), delay
+
+
+class SimulatorTransport(asyncio.Transport):
+    """Delivers the frames written by a client to a SimulatedBus"""
+
+    def __init__(self, bus: SimulatedBus, protocol: asyncio.Protocol):
+        super().__init__()
+        self.bus = bus
+        self.protocol = protocol
+        self._closing = False
+        self._pending = []
+
+    def write(self, data):
+        response, delay = self.bus.handle_frame(bytes(data))
+        if response is not None:
+            loop = asyncio.get_running_loop()
+            self._pending.append(
+                loop.call_later(delay, self.protocol.data_received, response)
+            )
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        for handle in self._pending:
+            handle.cancel()
+        self.protocol.connection_lost(None)
+
+
+class SimulatedRtuClient(ModbusRtuClient):
+    """ModbusRtuClient connected to a SimulatedBus instead of a serial port"""
+
+    def __init__(self, bus: SimulatedBus, slave_adr, baudrate=None, timeout=0.1):
+        super().__init__(
+            "simulator",
+            slave_adr,
+            baudrate=baudrate if baudrate else bus.baudrate,
+            timeout=timeout,
+        )
+        self.bus = bus
+
+    async def _open(self, protocol_factory):
+        protocol = protocol_factory()
+        protocol.connection_made(SimulatorTransport(self.bus, protocol))
+        return protocol
+
+
+async def _serve_connection(bus, framing, reader, writer):
+    try:
+        while True:
+            if framing == FRAMING_TCP:
+                header = await reader.readexactly(6)
+                length = struct.unpack(">H", header[4:6])[0]
+                pdu = await reader.readexactly(length)
+                frame = add_crc(pdu)
+            else:
+                frame = await reader.readexactly(7)
+                if frame[1] == 16:
+                    # byte count + data + CRC follow
+                    frame += await reader.readexactly(frame[6] + 2)
+                else:
+                    frame += await reader.readexactly(1)
+
+            response, delay = bus.handle_frame(frame)
+            await asyncio.sleep(delay)
+            if response is None:
+                continue
+            if framing == FRAMING_TCP:
+                response = response[:-2]
+                response = header[:4] + struct.pack(">H", len(response)) + response
+            writer.write(response)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_tcp(bus: SimulatedBus, host="127.0.0.1", port=0, framing=FRAMING_RTU):
+    """Expose a simulated bus as a TCP gateway, returns the asyncio server"""
+    return await asyncio.start_server(
+        lambda reader, writer: _serve_connection(bus, framing, reader, writer),
+        host,
+        port,
+    )
+
+
+# Simulated buses per port name, shared by all entries using the same port
+simulated_buses = {}
+
+
+def get_simulated_bus(name, baudrate=9600) -> SimulatedBus:
+    if name not in simulated_buses:
+        simulated_buses[name] = SimulatedBus(baudrate)
+    return simulated_buses[name]
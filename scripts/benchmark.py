@@ -0,0 +1,170 @@
+"""Benchmark the poll cycle and write latency against a simulated bus.
+
+Run from the root of the repository, e.g.:
+
+    python scripts/benchmark.py --modules 8 --baudrate 9600 --error-rate 0.01
+
+Reports per configuration the frames per poll cycle, the cycle wall time,
+the write latencies and the number of retried transactions. A write is
+acknowledged when the box answered it (debounce + write) and confirmed when
+the next scheduled read returned the written value. Use --json to store the
+results for comparison between versions.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+# The integration without Homeassistant. Appended: the select platform
+# (select.py) would shadow the standard library module.
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "custom_components", "ducobox")
+)
+
+from ducobox import DucoBoxBase, GenericActuator
+from simulator import SimulatedBus, simulated_buses
+
+# Type codes of the simulated modules, the master is always at adress 10
+module_types = [10, 24, 12, 13, 11, 17, 18, 14]
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _writer(dbb, actuator, interval, acknowledged, confirmed, stop):
+    """Write alternating values while the poll cycles run"""
+    value = actuator.min_value
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        value = (
+            actuator.max_value if value == actuator.min_value else actuator.min_value
+        )
+        start = time.monotonic()
+        await actuator.write(value)
+        acknowledged.append(time.monotonic() - start)
+
+        # A written register is read again by the next poll cycle
+        while actuator.last_poll is None and not stop.is_set():
+            await asyncio.sleep(0.001)
+        if actuator.last_poll is not None and actuator.value == value:
+            confirmed.append(time.monotonic() - start)
+
+
+async def run_benchmark(modules, baudrate, error_rate, cycles, write_interval, seed):
+    name = "benchmark-%d-%d-%s" % (modules, baudrate, error_rate)
+    bus = SimulatedBus(baudrate, error_rate=error_rate, seed=seed)
+    bus.add_device(
+        1, modules={10 * (idx + 1): module_types[idx] for idx in range(modules)}
+    )
+    simulated_buses[name] = bus
+
+    dbb = DucoBoxBase(name, baudrate=baudrate, simulate=True)
+    dbb.module_addresses = range(10, 90, 10)
+    await dbb.create_serial_connection()
+
+    start = time.monotonic()
+    await dbb.scan_modules()
+    scan_time = time.monotonic() - start
+
+    actuator = dbb.modules[0].sensors_by_name["auto min"]
+    assert isinstance(actuator, GenericActuator)
+
+    acknowledged = []
+    confirmed = []
+    stop = asyncio.Event()
+    writer = asyncio.create_task(
+        _writer(dbb, actuator, write_interval, acknowledged, confirmed, stop)
+    )
+
+    cycle_times = []
+    frames = []
+    retries = dbb.transactions.metrics.totals["retries"]
+    for _ in range(cycles):
+        frames_before = bus.frames
+        start = time.monotonic()
+        await dbb.update_sensors()
+        cycle_times.append(time.monotonic() - start)
+        frames.append(bus.frames - frames_before)
+
+    stop.set()
+    await writer
+    await dbb.close()
+
+    return {
+        "modules": modules,
+        "baudrate": baudrate,
+        "error_rate": error_rate,
+        "scan_time": scan_time,
+        "frames_per_cycle": statistics.mean(frames),
+        "cycle_time_mean": statistics.mean(cycle_times),
+        "cycle_time_p95": percentile(cycle_times, 0.95),
+        "write_ack_mean": statistics.mean(acknowledged) if acknowledged else None,
+        "write_ack_p95": percentile(acknowledged, 0.95),
+        "write_confirm_mean": statistics.mean(confirmed) if confirmed else None,
+        "write_confirm_p95": percentile(confirmed, 0.95),
+        "writes": len(acknowledged),
+        "retries": dbb.transactions.metrics.totals["retries"] - retries,
+    }
+
+
+def _format(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "%.3f" % value
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--baudrate", type=int, nargs="+", default=[9600])
+    parser.add_argument("--error-rate", type=float, nargs="+", default=[0.0])
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--write-interval", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="store the results in this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    results = []
+    for modules in args.modules:
+        if not 1 <= modules <= len(module_types):
+            parser.error("--modules must be between 1 and %d" % len(module_types))
+        for baudrate in args.baudrate:
+            for error_rate in args.error_rate:
+                results.append(
+                    asyncio.run(
+                        run_benchmark(
+                            modules,
+                            baudrate,
+                            error_rate,
+                            args.cycles,
+                            args.write_interval,
+                            args.seed,
+                        )
+                    )
+                )
+
+    columns = list(results[0].keys())
+    print("  ".join(columns))
+    for result in results:
+        print("  ".join(_format(result[col]).rjust(len(col)) for col in columns))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
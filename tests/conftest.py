@@ -0,0 +1,52 @@
+"""Test setup: the component is tested without Homeassistant.
+
+The modules of the component are imported as top level modules, like the
+benchmark does. The directory is appended to the path: select.py would
+shadow the standard library module otherwise.
+"""
+import asyncio
+import inspect
+import os
+import sys
+
+import pytest
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), os.pardir, "custom_components", "ducobox")
+)
+
+import ducobox  # noqa: E402
+import simulator  # noqa: E402
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Run the coroutine tests in their own event loop"""
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    kwargs = {
+        name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames
+    }
+    asyncio.run(pyfuncitem.obj(**kwargs))
+    return True
+
+
+@pytest.fixture
+def port(request):
+    """Name of a simulated port of its own, forgotten after the test"""
+    name = "/dev/test/%s" % request.node.name
+    yield name
+    ducobox.buses.pop(name, None)
+    simulator.simulated_buses.pop(name, None)
+
+
+@pytest.fixture
+def box(port):
+    """DucoBoxBase on the simulated port, connected and scanned by the test"""
+    return ducobox.DucoBoxBase(port, simulate=True)
+
+
+@pytest.fixture
+def simulated_box(port):
+    """The simulated DucoBox (slave 1) answering on the port"""
+    return simulator.get_simulated_bus(port).add_device(1)
@@ -0,0 +1,206 @@
+"""Block reads, the refusal fallback and the circuit breaker of a module"""
+from ducobox import (
+    BLOCK_FAILED,
+    BLOCK_READ,
+    BLOCK_REFUSED,
+    BREAKER_TIMEOUTS,
+    HEALTH_DEGRADED,
+    HEALTH_HEALTHY,
+    HEALTH_QUARANTINED,
+    MAX_BLOCK_GAP,
+    DucoCO2HumValve,
+    DucoCO2Valve,
+    Health,
+    plan_register_blocks,
+)
+
+# Base adress of the CO2 valve in the simulator (a module of every type)
+CO2_VALVE = 30
+
+
+def describe(blocks):
+    return [(block.functioncode, block.start, block.end) for block in blocks]
+
+
+def test_plan_register_blocks():
+    module = DucoCO2HumValve(None, 100)
+    blocks = plan_register_blocks(module, module.sensors)
+    # input registers 101..105 and 109, holding registers 100..106 and 109
+    assert describe(blocks) == [(4, 101, 109), (3, 100, 109)]
+    assert sum(len(block.sensors) for block in blocks) == len(module.sensors)
+    assert all(block.has_gaps for block in blocks)
+
+
+def test_plan_register_blocks_without_gaps():
+    module = DucoCO2HumValve(None, 100)
+    blocks = plan_register_blocks(module, module.sensors, max_gap=0)
+    assert describe(blocks) == [
+        (4, 101, 105),
+        (4, 109, 109),
+        (3, 100, 106),
+        (3, 109, 109),
+    ]
+    assert not any(block.has_gaps for block in blocks)
+
+
+def test_plan_register_blocks_gap_limit():
+    module = DucoCO2HumValve(None, 100)
+    holding = [sens for sens in module.sensors if sens.holding_reg]
+    # 107 and 108 are bridged, a gap of 2 registers
+    assert describe(plan_register_blocks(module, holding, max_gap=2)) == [
+        (3, 100, 109)
+    ]
+    assert describe(plan_register_blocks(module, holding, max_gap=1)) == [
+        (3, 100, 106),
+        (3, 109, 109),
+    ]
+
+
+def test_plan_register_blocks_subset():
+    module = DucoCO2HumValve(None, 100)
+    sensors = [module.sensors_by_name[name] for name in ("humidity", "status")]
+    assert describe(plan_register_blocks(module, sensors)) == [(4, 101, 105)]
+    assert plan_register_blocks(module, []) == []
+
+
+async def test_scan(box):
+    await box.create_serial_connection()
+    await box.scan_modules()
+    assert len(box.modules) == len(box.module_addresses)
+    module = next(mod for mod in box.modules if mod.base_adr == CO2_VALVE)
+    assert isinstance(module, DucoCO2Valve)
+    assert module.block_gap == MAX_BLOCK_GAP
+    assert module.sensors_by_name["localisation ID"].value == CO2_VALVE
+    assert all(sens.value is not None for sens in module.sensors)
+    await box.close()
+
+
+async def test_refused_block_falls_back_to_single_reads(box, simulated_box):
+    await box.create_serial_connection()
+    await box.scan_modules()
+    module = next(mod for mod in box.modules if mod.base_adr == CO2_VALVE)
+    temperature = module.sensors_by_name["temperature"]
+
+    # e.g. a firmware which no longer has the register and refuses spans over it
+    simulated_box.strict_spans = True
+    del simulated_box.input[temperature.register - 1]
+    block = plan_register_blocks(module, module.sensors)[0]
+    assert block.has_gaps
+    assert await block.read(box.transactions) == BLOCK_REFUSED
+
+    for sens in module.sensors:
+        sens.value = None
+    await box.update_module(module)
+    assert module.block_gap == 0
+    assert temperature.health.quarantined
+    assert all(
+        sens.value is not None for sens in module.sensors if sens is not temperature
+    )
+    assert not module.tripped
+    await box.close()
+
+
+async def test_failed_block_keeps_gap_bridging(box, simulated_box):
+    await box.create_serial_connection()
+    await box.scan_modules()
+    module = next(mod for mod in box.modules if mod.base_adr == CO2_VALVE)
+
+    simulated_box.silent.add(CO2_VALVE)
+    block = plan_register_blocks(module, module.sensors)[0]
+    assert await block.read(box.transactions) == BLOCK_FAILED
+    assert module.block_gap == MAX_BLOCK_GAP
+    assert module.tripped
+
+    # an open breaker stops the block reads until the module answers a probe
+    simulated_box.silent.clear()
+    frames = box.transactions.frames
+    assert await block.read(box.transactions) == BLOCK_FAILED
+    assert box.transactions.frames == frames
+    module.breaker.next_probe = 0
+    assert await box.probe_module(module)
+    assert await block.read(box.transactions) == BLOCK_READ
+    await box.close()
+
+
+def test_health():
+    health = Health(3)
+    assert health.state == HEALTH_HEALTHY
+    assert not health.failure(now=0)
+    assert not health.failure(now=0)
+    assert health.state == HEALTH_DEGRADED
+    assert health.failure(now=0)
+    assert health.state == HEALTH_QUARANTINED
+
+    assert not health.probe_due(now=1)
+    assert health.probe_due(now=health.next_probe)
+    # a failed probe doubles the interval
+    interval = health.next_probe
+    assert not health.failure(now=0)
+    assert health.next_probe == 2 * interval
+
+    assert health.success()
+    assert health.state == HEALTH_HEALTHY
+    assert not health.probe_due()
+    assert not health.success()
+
+
+def test_health_permanent_failure():
+    health = Health(3)
+    assert health.failure(permanent=True)
+    assert health.quarantined
+
+
+async def test_breaker_trip_and_recovery(box, simulated_box):
+    await box.create_serial_connection()
+    await box.scan_modules()
+    await box.update_sensors()
+    module = next(mod for mod in box.modules if mod.base_adr == CO2_VALVE)
+    others = [mod for mod in box.modules if mod is not module]
+
+    simulated_box.silent.add(CO2_VALVE)
+    for sens in module.sensors:
+        sens.last_poll = None
+    changes = await box.update_sensors()
+    assert module.tripped
+    assert module.breaker.failures == BREAKER_TIMEOUTS
+    assert all(sens.value is None for sens in module.sensors)
+    assert all(changes[sens.alias] is None for sens in module.sensors)
+    assert not any(mod.tripped for mod in others)
+
+    # an open breaker is only probed once the back-off expired
+    timeouts = box.transactions.metrics.totals["timeouts"]
+    await box.update_sensors()
+    assert box.transactions.metrics.totals["timeouts"] == timeouts
+
+    module.breaker.next_probe = 0
+    await box.update_sensors()
+    assert box.transactions.metrics.totals["timeouts"] == timeouts + 1
+    assert module.tripped
+
+    simulated_box.silent.clear()
+    module.breaker.next_probe = 0
+    changes = await box.update_sensors()
+    assert not module.tripped
+    assert module.health == HEALTH_HEALTHY
+    assert all(sens.value is not None for sens in module.sensors)
+    assert all(sens.alias in changes for sens in module.sensors)
+    await box.close()
+
+
+async def test_reconcile_sensors(box, simulated_box):
+    await box.create_serial_connection()
+    await box.scan_modules()
+    module = next(mod for mod in box.modules if mod.base_adr == CO2_VALVE)
+    flow = module.sensors_by_name["flow"]
+    temperature = module.sensors_by_name["temperature"]
+
+    # restored from a topology without the flow, the box lost the temperature
+    module.sensors.remove(flow)
+    simulated_box.strict_spans = True
+    del simulated_box.input[temperature.register - 1]
+    added, removed = await box.reconcile_sensors([module])
+    assert added == [flow]
+    assert removed == [temperature]
+    assert flow in module.sensors and temperature not in module.sensors
+    assert await box.reconcile_sensors([module]) == ([], [])
+    await box.close()
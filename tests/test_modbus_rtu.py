@@ -0,0 +1,175 @@
+"""CRC, framing and the RTU client against the simulated bus"""
+import pytest
+
+from modbus_rtu import (
+    InvalidResponseError,
+    NoResponseError,
+    SlaveReportedException,
+    add_crc,
+    build_request,
+    check_crc,
+    crc16,
+    decode_value,
+    encode_value,
+    parse_response,
+)
+from modbus_tcp import ModbusRtuOverTcpClient, ModbusTcpClient
+from simulator import (
+    FRAMING_RTU,
+    FRAMING_TCP,
+    DucoSimulator,
+    SimulatedBus,
+    SimulatedRtuClient,
+    serve_tcp,
+)
+
+
+def test_crc16():
+    # Read holding register 0 of slave 1, the CRC is sent low byte first
+    assert crc16(bytes.fromhex("010300000001")) == 0x0A84
+    assert add_crc(bytes.fromhex("010300000001")) == bytes.fromhex("010300000001840A")
+
+
+def test_check_crc():
+    frame = add_crc(bytes.fromhex("0104000900020000"))
+    assert check_crc(frame)
+    for idx in range(len(frame)):
+        corrupted = bytearray(frame)
+        corrupted[idx] ^= 0x01
+        assert not check_crc(bytes(corrupted))
+    assert not check_crc(frame[:3])
+
+
+@pytest.mark.parametrize(
+    "value, decimals, signed",
+    [(0, 0, False), (65535, 0, False), (-1, 0, True), (21.5, 1, True), (-0.25, 2, True)],
+)
+def test_value_round_trip(value, decimals, signed):
+    raw = encode_value(value, decimals, signed)
+    assert 0 <= raw <= 0xFFFF
+    assert decode_value(raw, decimals, signed) == value
+
+
+def test_encode_out_of_range():
+    with pytest.raises(ValueError):
+        encode_value(-1)
+    with pytest.raises(ValueError):
+        encode_value(6553.6, 1)
+
+
+def test_read_request_round_trip():
+    device = DucoSimulator(modules={20: 12})
+    pdu, response_length = build_request(1, 4, 19, count=3)
+    response = add_crc(device.process(pdu))
+    assert len(response) == response_length
+    assert check_crc(response)
+    # type code of the module, status and ventilation level
+    assert parse_response(pdu, response[:-2])[0] == 12
+
+
+def test_write_request_round_trip():
+    device = DucoSimulator(modules={20: 12})
+    pdu, response_length = build_request(1, 16, 24, values=[60, 70])
+    response = add_crc(device.process(pdu))
+    assert len(response) == response_length
+    assert parse_response(pdu, response[:-2]) is None
+    assert (device.holding[24], device.holding[25]) == (60, 70)
+
+    pdu, response_length = build_request(1, 6, 24, values=[40])
+    response = add_crc(device.process(pdu))
+    assert len(response) == response_length
+    assert parse_response(pdu, response[:-2]) is None
+    assert device.holding[24] == 40
+
+
+def test_parse_response_errors():
+    pdu, _ = build_request(1, 4, 19, count=1)
+    with pytest.raises(SlaveReportedException):
+        parse_response(pdu, bytes([1, 0x84, 2]))
+    with pytest.raises(InvalidResponseError):
+        parse_response(pdu, bytes([2, 4, 2, 0, 12]))
+    with pytest.raises(InvalidResponseError):
+        parse_response(pdu, bytes([1, 3, 2, 0, 12]))
+
+    pdu, _ = build_request(1, 16, 24, values=[60])
+    with pytest.raises(InvalidResponseError):
+        parse_response(pdu, bytes([1, 16, 0, 25, 0, 1]))
+
+
+def test_unsupported_function_code():
+    with pytest.raises(ValueError):
+        build_request(1, 5, 0)
+
+
+def simulated_client(**kwargs):
+    bus = SimulatedBus(**kwargs)
+    bus.add_device(1, modules={20: 12})
+    return bus, SimulatedRtuClient(bus, 1)
+
+
+async def test_client_round_trip():
+    bus, client = simulated_client(latency=0.001)
+    await client.connect()
+    assert await client.read_register(19, functioncode=4) == 12
+    await client.write_register(24, 55)
+    assert await client.read_registers(24, 1, functioncode=3) == [55]
+    await client.write_registers(25, [80])
+    assert await client.read_register(25) == 80
+    assert bus.frames == 5
+    await client.close()
+
+
+async def test_client_exception_response():
+    _, client = simulated_client(latency=0.001)
+    await client.connect()
+    # adress 18 belongs to no module
+    with pytest.raises(SlaveReportedException):
+        await client.read_registers(18, 1, functioncode=4)
+    # the client stays usable after the short exception frame
+    assert await client.read_register(19, functioncode=4) == 12
+    await client.close()
+
+
+async def test_client_no_response():
+    bus, client = simulated_client(latency=0.001)
+    await client.connect()
+    with pytest.raises(NoResponseError):
+        await client.read_registers(19, 1, functioncode=4, slave_adr=2, timeout=0.02)
+
+    bus.devices[1].silent.add(20)
+    with pytest.raises(NoResponseError):
+        await client.read_registers(19, 1, functioncode=4, timeout=0.02)
+    await client.close()
+
+
+async def test_client_corrupted_response():
+    bus, client = simulated_client(latency=0.001, error_rate=1.0, seed=1)
+    await client.connect()
+    with pytest.raises((InvalidResponseError, NoResponseError)):
+        await client.read_registers(19, 1, functioncode=4, timeout=0.05)
+    assert bus.lost + bus.corrupted == 1
+    await client.close()
+
+
+@pytest.mark.parametrize(
+    "client_class, framing",
+    [(ModbusRtuOverTcpClient, FRAMING_RTU), (ModbusTcpClient, FRAMING_TCP)],
+)
+async def test_tcp_round_trip(client_class, framing):
+    bus = SimulatedBus(latency=0.001)
+    bus.add_device(1, modules={20: 12})
+    server = await serve_tcp(bus, framing=framing)
+    host, tcp_port = server.sockets[0].getsockname()[:2]
+    client = client_class(host, tcp_port, 1, timeout=0.5)
+    try:
+        await client.connect()
+        assert await client.read_registers(19, 3, functioncode=4) == [
+            12,
+            *(bus.devices[1].input[adr] for adr in (20, 21)),
+        ]
+        await client.write_registers(24, [45, 90])
+        assert await client.read_registers(24, 2) == [45, 90]
+    finally:
+        await client.close()
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,123 @@
+"""Coalescing, debouncing and draining of the actuator writes"""
+import asyncio
+
+import ducobox
+
+# Sensorless valve: flow, auto min and auto max are adjacent holding registers
+VALVE = 20
+VALVE_TYPE = 11
+
+
+async def valve(box, debounce=0.01):
+    await box.create_serial_connection()
+    box.transactions.writes.debounce = debounce
+    return box.create_module(VALVE, VALVE_TYPE)
+
+
+def holding(simulated_box, actuator):
+    return simulated_box.holding[actuator.holding_reg - 1]
+
+
+async def test_latest_value_wins(box, simulated_box):
+    module = await valve(box)
+    flow = module.sensors_by_name["flow"]
+
+    await asyncio.gather(flow.write(30), flow.write(40), flow.write(50))
+    assert box.transactions.frames == 1
+    assert holding(simulated_box, flow) == 50
+    assert flow.value == 50
+    assert flow.last_poll is None
+    await box.close()
+
+
+async def test_adjacent_registers_in_one_transaction(box, simulated_box):
+    module = await valve(box)
+    values = {"flow": 35, "auto min": 20, "auto max": 90}
+
+    await asyncio.gather(
+        *[module.sensors_by_name[name].write(value) for name, value in values.items()]
+    )
+    assert box.transactions.frames == 1
+    for name, value in values.items():
+        assert holding(simulated_box, module.sensors_by_name[name]) == value
+    await box.close()
+
+
+async def test_separate_spans(box, simulated_box):
+    module = await valve(box)
+    flow = module.sensors_by_name["flow"]
+    setpoint = module.sensors_by_name["ventilation setpoint"]
+
+    await asyncio.gather(flow.write(35), setpoint.write(70))
+    assert box.transactions.frames == 2
+    assert holding(simulated_box, flow) == 35
+    assert holding(simulated_box, setpoint) == 70
+    await box.close()
+
+
+async def test_refused_span_is_written_per_register(box, simulated_box):
+    module = await valve(box)
+    auto_min = module.sensors_by_name["auto min"]
+    auto_max = module.sensors_by_name["auto max"]
+    del simulated_box.holding[auto_min.holding_reg - 1]
+
+    await asyncio.gather(auto_min.write(20), auto_max.write(90))
+    # the span, then each register on its own
+    assert box.transactions.frames == 3
+    assert holding(simulated_box, auto_max) == 90
+    assert auto_min.health.quarantined
+    await box.close()
+
+
+async def test_write_settings_supersedes_pending(box, simulated_box):
+    module = await valve(box, debounce=10)
+    flow = module.sensors_by_name["flow"]
+
+    writer = asyncio.create_task(flow.write(30))
+    await asyncio.sleep(0)
+    await module.write_settings({"flow": 60})
+    assert holding(simulated_box, flow) == 60
+
+    await box.transactions.writes.flush()
+    await writer
+    # nothing left to write for the superseded value
+    assert holding(simulated_box, flow) == 60
+    await box.close()
+
+
+async def test_close_drains_pending_writes(box, simulated_box):
+    module = await valve(box, debounce=10)
+    flow = module.sensors_by_name["flow"]
+
+    writer = asyncio.create_task(flow.write(45))
+    await asyncio.sleep(0)
+    assert holding(simulated_box, flow) != 45
+    await box.close()
+    assert writer.done() and writer.exception() is None
+    assert holding(simulated_box, flow) == 45
+
+
+async def test_close_waits_for_running_flush(box, simulated_box):
+    module = await valve(box, debounce=0)
+    flow = module.sensors_by_name["flow"]
+
+    writer = asyncio.create_task(flow.write(45))
+    # the debounce timer started the flush, the frame is on the wire
+    while box.transactions.frames == 0:
+        await asyncio.sleep(0.001)
+    await box.close()
+    assert writer.done() and writer.exception() is None
+    assert holding(simulated_box, flow) == 45
+
+
+async def test_writers_released_when_drain_times_out(box, simulated_box, monkeypatch):
+    monkeypatch.setattr(ducobox, "WRITE_DRAIN_TIMEOUT", 0.2)
+    module = await valve(box, debounce=10)
+    flow = module.sensors_by_name["flow"]
+    simulated_box.silent.add(VALVE)
+
+    writer = asyncio.create_task(flow.write(45))
+    await asyncio.sleep(0)
+    await box.close()
+    await asyncio.wait_for(asyncio.wait([writer]), 1)
+    assert writer.cancelled()